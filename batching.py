@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from config import Config as cfg
+from dataprocessor import image_digest
+from picker_model import rank_predictions
+
+
+class BatchedPicker():
+    """
+    Batching inference service around TargetModel.
+
+    Listings submit their loaded images and get a Future back. A background thread packs
+    images from many listings into batches of up to batch_size, runs one model call per
+    batch and scatters the scores back to each listing. A listing waits at most max_wait
+    seconds for its batch to fill before a partial batch is run. Partial batches are not
+    padded, since padded rows cost as much CPU time as real ones.
+
+    With the picker's embedding store, images whose embedding is stored skip the backbone:
+    only the others are run through it (and their embeddings stored), and the head scores
+    every image of the batch, as TargetModel.score_images does. The cascade is not
+    batched; with it, listings are scored one at a time by the picker itself.
+
+    Only the batching thread touches the Keras model, so score_images is safe to call
+    from several threads at once.
+    """
+    def __init__(self, picker, batch_size=None, max_wait=None):
+        self.picker = picker
+        self.batch_size = batch_size or cfg.batch_size
+        self.max_wait = cfg.picker_max_wait if max_wait is None else max_wait
+        self.passthrough_lock = threading.Lock() if picker.cascade else None
+        if picker.cascade:
+            logging.warning("The picker cascade cannot be batched across listings. Scoring listings one at a time")
+        self.requests = queue.Queue()
+        self.batches_run = 0
+        self.images_scored = 0
+        self.thread = threading.Thread(target=self._run, name='batched-picker', daemon=True)
+        self.thread.start()
+
+    def submit(self, image_links, images):
+        """
+        Queue a listing's images for scoring.
+
+        Args:
+            image_links (list): Links of the loaded images.
+            images (list): Preprocessed image tensors aligned with image_links.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the same sorted list as TargetModel.score_images.
+        """
+        future = Future()
+        if not images:
+            future.set_result([])
+        elif self.passthrough_lock is not None:
+            with self.passthrough_lock:
+                try:
+                    future.set_result(self.picker.score_images(image_links, images))
+                except Exception as e:
+                    future.set_exception(e)
+        else:
+            stored = {}
+            if self.picker.embedding_store is not None:
+                stored = self.picker.stored_embeddings(image_links)
+            self.requests.put({'image_links': image_links, 'images': images, 'future': future,
+                               'vectors': [stored.get(l) for l in image_links],
+                               'scores': [None] * len(images), 'remaining': len(images)})
+        return future
+
+    def score_images(self, image_links, images):
+        return self.submit(image_links, images).result()
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    @staticmethod
+    def _slots(request):
+        return [(request, i) for i in range(len(request['images']))]
+
+    def _run(self):
+        closing = False
+        while not closing:
+            request = self.requests.get()
+            if request is None:
+                break
+            slots = self._slots(request)
+
+            # Gather more listings until the batch is full or the first one's deadline passes
+            deadline = time.monotonic() + self.max_wait
+            while len(slots) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                slots.extend(self._slots(request))
+
+            while slots:
+                batch, slots = slots[:self.batch_size], slots[self.batch_size:]
+                self._run_batch(batch)
+
+    def _predict(self, batch):
+        if self.picker.embedding_store is None:
+            images = self.picker.processor.stack_images([request['images'][i] for request, i in batch])
+            return self.picker.predictor.predict_on_batch(images)
+
+        missing = [(request, i) for request, i in batch if request['vectors'][i] is None]
+        if missing:
+            images = self.picker.processor.stack_images([request['images'][i] for request, i in missing])
+            vectors = self.picker.backbone.predict_on_batch(images)
+            digests = {}
+            for (request, i), vector in zip(missing, vectors):
+                request['vectors'][i] = vector
+                digests[image_digest(request['image_links'][i])] = vector
+            self.picker.embedding_store.put_many({d: v for d, v in digests.items() if d})
+        return self.picker.head.predict_on_batch(np.stack([request['vectors'][i] for request, i in batch]))
+
+    def _run_batch(self, batch):
+        try:
+            predictions = np.asarray(self._predict(batch)).reshape(-1)
+        except Exception as e:
+            logging.error(f"Batched picker inference failed: {e}")
+            for request, _ in batch:
+                if not request['future'].done():
+                    request['future'].set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.images_scored += len(batch)
+        for (request, i), score in zip(batch, predictions):
+            if request['future'].done():
+                continue
+            request['scores'][i] = score
+            request['remaining'] -= 1
+            if request['remaining'] == 0:
+                request['future'].set_result(rank_predictions(request['image_links'], request['scores']))
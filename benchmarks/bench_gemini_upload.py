@@ -0,0 +1,89 @@
+"""
+Bytes saved and latency change from preparing images before Gemini uploads.
+
+Offline, every image in --image-dir is run through gemini_model.prepare_upload_image and
+the original and uploaded sizes are compared. With --api-key, --num-calls images are also
+sent to Gemini once as-is and once prepared, and the request latencies are compared.
+
+Usage:
+    python benchmarks/bench_gemini_upload.py --image-dir image_cache/objects
+    python benchmarks/bench_gemini_upload.py --api-key KEY --num-calls 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config as cfg
+from gemini_model import prepare_upload_image
+
+
+def find_images(image_dir):
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for file in sorted(files):
+            if not file.endswith('.tmp'):
+                paths.append(os.path.join(root, file))
+    return paths
+
+
+def timed_call(model, image_bytes, mime_type):
+    start = time.perf_counter()
+    model.generate_content([{"inline_data": {"mime_type": mime_type, "data": image_bytes}},
+                            "Read the part number on this label. Answer with the number only."])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Gemini upload image preparation')
+    parser.add_argument('--image-dir', default=os.path.join(cfg.image_cache_dir, 'objects'))
+    parser.add_argument('--max-long-edge', type=int, default=cfg.gemini_image_max_long_edge)
+    parser.add_argument('--quality', type=int, default=cfg.gemini_image_quality)
+    parser.add_argument('--api-key', default=None, help='Also measure request latency against Gemini')
+    parser.add_argument('--model', default='gemini-1.5-flash')
+    parser.add_argument('--num-calls', type=int, default=10)
+    args = parser.parse_args()
+
+    paths = find_images(args.image_dir)
+    if not paths:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    original_bytes, uploaded_bytes, prepare_times, prepared = 0, 0, [], []
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+        start = time.perf_counter()
+        try:
+            upload, mime_type = prepare_upload_image(content, args.max_long_edge, args.quality)
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        prepare_times.append(time.perf_counter() - start)
+        original_bytes += len(content)
+        uploaded_bytes += len(upload)
+        prepared.append((content, upload, mime_type))
+
+    print(f"{len(prepared)} images: {original_bytes / 1024 ** 2:.1f} MiB -> {uploaded_bytes / 1024 ** 2:.1f} MiB "
+          f"({1 - uploaded_bytes / max(original_bytes, 1):.1%} saved), "
+          f"prepare median {statistics.median(prepare_times) * 1000:.1f} ms")
+
+    if args.api_key is None:
+        return
+
+    import google.generativeai as genai
+    genai.configure(api_key=args.api_key)
+    model = genai.GenerativeModel(args.model)
+
+    # Largest originals first: that is where preparation matters
+    sample = sorted(prepared, key=lambda p: len(p[0]), reverse=True)[:args.num_calls]
+    original_latency = [timed_call(model, content, 'image/jpeg') for content, _, _ in sample]
+    prepared_latency = [timed_call(model, upload, mime_type) for _, upload, mime_type in sample]
+    print(f"Gemini latency over {len(sample)} calls: original median {statistics.median(original_latency):.2f} s, "
+          f"prepared median {statistics.median(prepared_latency):.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Compare HTML parsing backends on saved listing and search result pages.
+
+For every backend whose package is installed, reports pages parsed per second and
+whether its extracted fields agree with the reference: the fixture's <name>.expected.json
+when there is one (a list of (image, link) pairs for search pages, a dict of listing
+fields otherwise), the 'html.parser' backend's output if not.
+
+The committed fixtures are hand-written pages in the markup the scraper targets. They are
+much smaller than live pages, so the absolute rates overstate real throughput; save live
+pages with --fetch for representative numbers.
+
+Usage:
+    python benchmarks/bench_html_parsing.py --fetch https://page.auctions.yahoo.co.jp/jp/auction/...
+    python benchmarks/bench_html_parsing.py --fixtures benchmarks/fixtures --repeat 20
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parsing import get_html_backend
+
+BACKENDS = ('html.parser', 'lxml', 'selectolax', 'stream')
+# Packages each backend needs; 'stream' only needs bs4 for its generic search-page fallback
+REQUIRES = {'html.parser': ('bs4',), 'lxml': ('bs4', 'lxml'), 'selectolax': ('selectolax',), 'stream': ()}
+
+
+def fetch_fixtures(urls, fixtures_dir):
+    from dataprocessor import Processor
+
+    processor = Processor(image_size=(224, 224), batch_size=1)
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for url in urls:
+        html = processor.fetch_listing_html(url)
+        if html is None:
+            print(f"Could not fetch {url}")
+            continue
+        path = os.path.join(fixtures_dir, hashlib.sha256(url.encode()).hexdigest()[:16] + '.html')
+        with open(path, 'wb') as f:
+            f.write(html)
+        print(f"Saved {url} -> {path}")
+
+
+def available(name):
+    return all(importlib.util.find_spec(package) is not None for package in REQUIRES[name])
+
+
+def parse(backend, html, kind=None):
+    # Search result pages have product items, listing pages have product images
+    if kind == 'listing':
+        return backend.listing(html)
+    items = [list(item) for item in backend.search_items(html)]
+    return items if items or kind == 'search' else backend.listing(html)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML parsing backends')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+    parser.add_argument('--fetch', nargs='*', default=[], help='Listing URLs to save into the fixtures directory first')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_fixtures(args.fetch, args.fixtures)
+
+    pages, reference, kinds = [], [], []
+    for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+        expected_path = path[:-len('.html')] + '.expected.json'
+        expected = None
+        if os.path.exists(expected_path):
+            with open(expected_path, 'r', encoding='utf-8') as f:
+                expected = json.load(f)
+        reference.append(expected)
+        kinds.append(None if expected is None else 'search' if isinstance(expected, list) else 'listing')
+    if not pages:
+        raise SystemExit(f"No .html fixtures in {args.fixtures}. Save some with --fetch URL ...")
+
+    if None in reference:
+        if not available('html.parser'):
+            raise SystemExit("Fixtures without .expected.json need bs4 for the 'html.parser' reference")
+        reference_backend = get_html_backend('html.parser')
+        reference = [parse(reference_backend, html) if expected is None else expected
+                     for html, expected in zip(pages, reference)]
+
+    for name in BACKENDS:
+        if not available(name):
+            print(f"{name:12s} not installed, skipped")
+            continue
+        backend = get_html_backend(name)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [parse(backend, html, kind) for html, kind in zip(pages, kinds)]
+        elapsed = time.perf_counter() - start
+        agree = sum(result == expected for result, expected in zip(results, reference))
+        print(f"{name:12s} {len(pages) * args.repeat / elapsed:8.1f} pages/s   agrees on {agree}/{len(pages)} pages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Parity and speed of the TFLite picker against the Keras picker.
+
+Every listing of the labelled set is scored by the Keras model and by the exported
+TFLite model (export_model.py) at each thread count. Reported per backend:
+  - top-1 agreement: listings where it picks the same image as Keras
+  - top-1 accuracy: listings where the picked image is the labelled one
+  - latency per listing (median / p95) and throughput in images per second
+
+Usage:
+    python benchmarks/bench_inference_backends.py --dataset predicted_data-20240821T151905Z-001.zip \\
+        --max-listings 200 --threads 1 2 4
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config as cfg
+from dataprocessor import Processor, read_label_files
+from inference_backend import KerasBackend, TFLiteBackend
+from picker_model import build_model
+
+
+def load_listings(dataset_path, max_listings):
+    processor = Processor(cfg.image_size, cfg.batch_size, preprocess_mode='pil')
+    listings = []
+    for labels in read_label_files(dataset_path)[:max_listings]:
+        loaded = processor.load_images(list(labels))
+        if not loaded or not any(labels[l] for l, _ in loaded):
+            continue
+        images = np.stack([np.asarray(img, dtype=np.float32) for _, img in loaded])
+        listings.append((images, np.array([labels[l] for l, _ in loaded])))
+    return listings
+
+
+def run_backend(backend, listings):
+    backend.predict_on_batch(listings[0][0])  # warm-up
+    picks, latencies = [], []
+    for images, _ in listings:
+        start = time.perf_counter()
+        scores = np.asarray(backend.predict_on_batch(images)).reshape(-1)
+        latencies.append(time.perf_counter() - start)
+        picks.append(int(np.argmax(scores)))
+    return picks, latencies
+
+
+def report(name, picks, latencies, listings, reference_picks):
+    num_images = sum(len(images) for images, _ in listings)
+    agreement = np.mean([p == r for p, r in zip(picks, reference_picks)])
+    accuracy = np.mean([labels[p] == 1 for p, (_, labels) in zip(picks, listings)])
+    latencies_ms = sorted(l * 1000 for l in latencies)
+    p95 = latencies_ms[min(len(latencies_ms) - 1, int(0.95 * len(latencies_ms)))]
+    print(f"{name:14s} agree {agreement:6.1%}  top-1 acc {accuracy:6.1%}  "
+          f"median {statistics.median(latencies_ms):7.1f} ms  p95 {p95:7.1f} ms  "
+          f"{num_images / sum(latencies):7.1f} images/s")
+
+
+def main():
+    default_dataset = next(iter(sorted(glob.glob(os.path.join(ROOT, 'predicted_data*.zip')))), None)
+    parser = argparse.ArgumentParser(description='Compare Keras and TFLite picker backends')
+    parser.add_argument('--dataset', default=default_dataset, help='Label folder or zip, e.g. the predicted_data export')
+    parser.add_argument('--max-listings', type=int, default=100)
+    parser.add_argument('--weights', default=cfg.model_path)
+    parser.add_argument('--tflite-model', default=cfg.tflite_model_path)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    if args.dataset is None:
+        raise SystemExit("No dataset given and no predicted_data*.zip found")
+
+    listings = load_listings(args.dataset, args.max_listings)
+    if not listings:
+        raise SystemExit("No listings with a loadable labelled image")
+    print(f"{len(listings)} listings, {sum(len(images) for images, _ in listings)} images")
+
+    model = build_model(1)
+    model.load_weights(args.weights)
+    reference_picks, latencies = run_backend(KerasBackend(model), listings)
+    report('keras', reference_picks, latencies, listings, reference_picks)
+
+    for num_threads in args.threads:
+        picks, latencies = run_backend(TFLiteBackend(args.tflite_model, num_threads=num_threads), listings)
+        report(f'tflite x{num_threads}', picks, latencies, listings, reference_picks)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare picker preprocessing modes for CPU time and peak RSS per 100 images.
+
+'pil' is the original path: PIL resize and float32 normalisation per image in numpy.
+'graph' keeps encoded bytes until tf.data decodes, resizes and normalises them.
+
+Each mode runs in its own subprocess so peak RSS is not shared between them.
+
+Usage:
+    python benchmarks/bench_preprocess.py --image-dir image_cache/objects --num-images 100
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config as cfg
+
+
+def find_images(image_dir, num_images):
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for file in sorted(files):
+            if not file.endswith('.tmp'):
+                paths.append(os.path.join(root, file))
+    if not paths:
+        raise SystemExit(f"No images found in {image_dir}")
+    # Repeat the available images if there are fewer than requested
+    return [paths[i % len(paths)] for i in range(num_images)]
+
+
+def run_mode(mode, paths):
+    from io import BytesIO
+    from PIL import Image
+    import tensorflow as tf
+    from dataprocessor import Processor, encode_image
+
+    raw = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            raw.append(f.read())
+
+    processor = Processor(cfg.image_size, cfg.batch_size, preprocess_mode=mode)
+    # Warm up TF so one-off graph construction is not counted
+    warmup = [img for _, img in processor.load_images(paths[:2])]
+    for batch in processor.batch_images(warmup):
+        batch.numpy()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    if mode == 'pil':
+        images = [tf.convert_to_tensor(encode_image(Image.open(BytesIO(b)).convert('RGB'))) for b in raw]
+    else:
+        images = raw
+    for batch in processor.batch_images(images):
+        batch.numpy()
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    per_100 = 100 / len(paths)
+    return {
+        'mode': mode,
+        'images': len(paths),
+        'cpu_seconds_per_100': cpu * per_100,
+        'wall_seconds_per_100': wall * per_100,
+        'peak_rss_mb': rss_after / 1024,
+        'peak_rss_growth_mb': (rss_after - rss_before) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark picker preprocessing modes")
+    parser.add_argument('--image-dir', type=str, default=os.path.join(cfg.image_cache_dir, 'objects'),
+                        help="Directory of encoded images, e.g. the image cache objects directory")
+    parser.add_argument('--num-images', type=int, default=100)
+    parser.add_argument('--mode', choices=['pil', 'graph', 'both'], default='both')
+    args = parser.parse_args()
+
+    if args.mode != 'both':
+        print(json.dumps(run_mode(args.mode, find_images(args.image_dir, args.num_images))))
+        return
+
+    results = []
+    for mode in ('pil', 'graph'):
+        output = subprocess.run([sys.executable, __file__, '--mode', mode, '--image-dir', args.image_dir,
+                                 '--num-images', str(args.num_images)],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<8}{'cpu s/100':>12}{'wall s/100':>12}{'peak RSS MB':>14}{'RSS growth MB':>16}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['cpu_seconds_per_100']:>12.2f}{r['wall_seconds_per_100']:>12.2f}"
+              f"{r['peak_rss_mb']:>14.1f}{r['peak_rss_growth_mb']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Report CLI startup time for each entry point.
+
+Each entry point is run with --help in a fresh interpreter several times. The report
+shows the wall time from interpreter start to exit, and which heavy dependencies were
+imported on the way. None of them should be for --help. With --importtime the slowest
+imports from `python -X importtime` are listed as well. --baseline runs the same
+report on another checkout (e.g. the commit before the lazy imports) for comparison.
+
+The raw output of a run against the commit before the lazy imports is in
+benchmarks/startup_results.txt.
+
+Usage:
+    python benchmarks/startup_report.py --runs 5 --importtime
+    git worktree add ../extra-baseline <commit> && python benchmarks/startup_report.py --baseline ../extra-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ('main.py', 'collect_data.py', 'train.py')
+
+HEAVY_MODULES = ('tensorflow', 'pandas', 'telebot', 'IPython', 'google.generativeai', 'PIL', 'bs4')
+
+# Runs the entry point as __main__ and prints the heavy modules it imported
+PROBE = """
+import json, runpy, sys
+sys.argv = [sys.argv[1], '--help']
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps([m for m in {heavy} if m in sys.modules]) + '\\n')
+"""
+
+
+def run_once(entry, root=ROOT):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', PROBE.format(heavy=HEAVY_MODULES), entry],
+                          cwd=root, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    try:
+        imported = json.loads(proc.stderr.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        # The entry point failed before the probe could report, e.g. a missing dependency
+        return elapsed, None, proc.stderr.strip().splitlines()[-1:] or ['no output']
+    return elapsed, imported, None
+
+
+def slowest_imports(entry, top=10, root=ROOT):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', entry, '--help'], cwd=root, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package", one row per module
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def report_startup(root, runs, importtime):
+    report = {}
+    for entry in ENTRY_POINTS:
+        times, imported, error = [], [], None
+        for _ in range(runs):
+            elapsed, imported, error = run_once(entry, root)
+            if error:
+                break
+            times.append(elapsed)
+        if error:
+            print(f"{entry:16s} failed: {error[0]}")
+            report[entry] = {'error': error[0]}
+            continue
+        report[entry] = {'median_s': statistics.median(times), 'min_s': min(times), 'heavy_imports': imported}
+        print(f"{entry:16s} median {statistics.median(times):6.3f}s  min {min(times):6.3f}s  "
+              f"heavy imports: {', '.join(imported) or 'none'}")
+        if importtime:
+            for cumulative_us, name in slowest_imports(entry, root=root):
+                print(f"    {cumulative_us / 1e6:6.3f}s  {name}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure --help startup time of the CLI entry points')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports of each entry point')
+    parser.add_argument('--baseline', default=None, help='Checkout of an earlier revision to report on as well')
+    parser.add_argument('--output', default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    print(f"current ({ROOT})")
+    report = report_startup(ROOT, args.runs, args.importtime)
+    if args.baseline:
+        print(f"baseline ({args.baseline})")
+        report = {'current': report, 'baseline': report_startup(os.path.abspath(args.baseline), args.runs, args.importtime)}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
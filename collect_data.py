@@ -1,30 +1,82 @@
+from config import Config as cfg
 from picker_model import TargetModel 
+from crawl_index import CrawlIndex, auction_id_from_url
+from rate_limiter import RequestCancelled
 
 import argparse
 
 import json 
+import logging
 import os 
-
-def collect_links(t, first_page_link, max_pages=3, max_links=90, verbose=0) -> list:
-    products_links = list()
-    for i in range(max_pages):
-        page_num = i + 1
-        # Construct the URL for each page by updating the 'b' parameter
-        main_link = first_page_link.replace('b=1', f'b={1 + (page_num - 1) * 100}')
-        
-        # Extract links for Yahoo Auctions product pages
-        pages = [link for _, link in t.processor.get_page_content(main_link) if link.startswith("https://page.auctions.yahoo.co.jp/jp/auction/")]
-        
-        if verbose:
-            print('\n'.join(pages))
-        
-        products_links.extend(pages)
-        
-        # Stop if we've reached the maximum number of links
-        if len(products_links) >= max_links:
-            break
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+def page_url(first_page_link, page_num):
+    # Set the 'b' (first result offset) query parameter for the given 1-based page of 'n' results
+    parts = urlsplit(first_page_link)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    page_size = int(dict(query).get('n', 100))
+    query = [(k, v) for k, v in query if k != 'b']
+    query.append(('b', str(1 + (page_num - 1) * page_size)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def collect_links(t, first_page_link, max_pages=3, max_links=90, verbose=0, crawl_index=None, window=None) -> list:
+    # Fetch up to `window` search pages ahead of the one being merged (by default all
+    # max_pages at once); the host rate limiter spaces the actual requests. Once enough links
+    # are found, `stop` keeps any page that is not already on the wire from being requested.
+    stop = threading.Event()
+
+    def fetch_page(url):
+        if stop.is_set():
+            return []
+        try:
+            return list(t.processor.get_page_content(url, cancel_event=stop))
+        except RequestCancelled:
+            return []
+
+    window = window or cfg.collect_links_window or max_pages
+    window = max(1, min(window, max_pages))
+    executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix='collect-links')
+    futures = {}
+
+    def submit(page_num):
+        if page_num <= max_pages:
+            futures[page_num] = executor.submit(fetch_page, page_url(first_page_link, page_num))
+
+    for page_num in range(1, window + 1):
+        submit(page_num)
+
+    products_links = dict()  # insertion-ordered set
+    try:
+        # Merge pages in order as they arrive
+        for page_num in range(1, max_pages + 1):
+            # Extract links for Yahoo Auctions product pages
+            pages = [link for _, link in futures.pop(page_num).result() if link.startswith("https://page.auctions.yahoo.co.jp/jp/auction/")]
+            
+            if verbose:
+                print('\n'.join(pages))
+            
+            products_links.update(dict.fromkeys(pages))
+            
+            # Stop if we've reached the maximum number of links
+            if len(products_links) >= max_links:
+                break
+
+            # Results are sorted newest first, so a page of known auctions means the rest are known too
+            if crawl_index is not None and pages:
+                page_ids = {auction_id_from_url(link) for link in pages}
+                if page_ids <= crawl_index.known_ids(page_ids):
+                    logging.info(f'page {page_num} only has known auctions, stopping pagination')
+                    break
+
+            submit(page_num + window)
+    finally:
+        # Pages still queued are cancelled, pages waiting for a rate limiter slot give up
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
     
-    return products_links[:max_links]
+    return list(products_links)[:max_links]
 
 
 def encode_images(t, page_link): 
@@ -34,7 +86,6 @@ def encode_images(t, page_link):
   target_link = t.do_inference_minimodel(image_links)
 
   print(target_link)
-  clear_output(wait=True)
   return {
       **{k: 0 for k in [link for link in image_links if link != target_link]},
       **{target_link: 1}, 
@@ -57,17 +108,20 @@ def map_fn(t, target_folder, page_link):
     json.dump(predicted_data, f)
 
 
-def main(main_page_link, target_folder_name) -> None : 
+def main(main_page_link, target_folder_name, max_age_days=None) -> None : 
   t = TargetModel()
+  crawl_index = CrawlIndex(namespace='picker_labels',
+                           max_age=None if max_age_days is None else max_age_days * 24 * 3600)
 
-  products_links = collect_links(t, main_page_link) 
+  products_links = collect_links(t, main_page_link, crawl_index=crawl_index) 
   
-  # remove duplicates 
-  products_links = list(set(products_links))
+  # remove duplicates and listings labelled recently
+  products_links = crawl_index.filter_new(list(set(products_links)))
 
   for i, page_link in enumerate(products_links):
     print(f'page {i+1}/{len(products_links)}')
     map_fn(t, target_folder_name, page_link)
+    crawl_index.record(page_link, {'labels_file': f'{target_folder_name}/{page_link.split("/")[-1]}.json'})
 
 def parse_args():
     """
@@ -81,12 +135,13 @@ def parse_args():
     
     parser.add_argument('--page-link', type=str, required=True, help="The main page link to start collecting product links from")
     parser.add_argument('--folder-name', type=str, required=True, help="The target folder name where the JSON files will be saved")
+    parser.add_argument('--max-age-days', type=float, default=None, help="Re-label listings last processed more than this many days ago")
     
     args = parser.parse_args()
     
-    return args.page_link, args.folder_name
+    return args.page_link, args.folder_name, args.max_age_days
 
 if __name__ == '__main__': 
-  page_link, folder_name = parse_args()
+  page_link, folder_name, max_age_days = parse_args()
 
-  main(page_link, folder_name)
+  main(page_link, folder_name, max_age_days)
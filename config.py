@@ -1,6 +1,3 @@
-import time
-
-
 class Config():
 
   mainpage_url = "https://auctions.yahoo.co.jp/category/list/2084017107/?p=アウディ用&auccat=2084017107&istatus=2%2C1&is_postage_mode=0&dest_pref_code=13&exflg=1&b=1&n=100&s1=new&o1=d&brand_id=118482"
@@ -12,6 +9,118 @@ class Config():
 
   batch_size = 32
 
+  # Run metrics (metrics.py): counters and latency histograms, written at the end of a run.
+  # Disabled metrics cost one attribute check per instrumented call
+  metrics_enabled = True
+
+  # Picker inference backend (inference_backend.py): 'keras' runs the checkpoint above, 'tflite'
+  # runs the int8 model written by export_model.py with tflite_num_threads CPU threads.
+  # The TFLite model is end to end, so the embedding cache is not used with it
+  inference_backend = 'keras'
+  tflite_model_path = 'picker_int8.tflite'
+  tflite_num_threads = 4
+
+  # Sharded TFRecord picker dataset (dataset_shards.py): output directory and examples per shard
+  dataset_shard_dir = 'picker_shards'
+  dataset_shard_size = 1024
+
+  # Streaming early exit (TargetModel.stream_candidates): the first image scoring at least this
+  # goes to the recognizer while the rest of the listing is still loading. None disables it
+  early_exit_threshold = None
+
+  # Picker resolution cascade (TargetModel.cascade_score): every image is scored at
+  # cascade_image_size, and only the cascade_top_k best plus any scoring at least
+  # cascade_threshold are re-scored at image_size
+  cascade_enabled = False
+  cascade_image_size = (160, 160)
+  cascade_top_k = 3
+  cascade_threshold = 0.1
+
+  # Picker preprocessing: 'pil' resizes and normalises in numpy per image, 'graph' keeps images
+  # as encoded bytes and decodes, resizes and normalises them in a tf.data map
+  preprocess_mode = 'pil'
+
+  # Pooled backbone embeddings keyed by image content hash (embedding_store.py). On a hit
+  # TargetModel only runs the picker head
+  embedding_cache_enabled = True
+  embedding_store_path = 'embeddings.sqlite'
+
+  # Final Gemini answers keyed by image hash, brand, prompt hash and model (recognition_cache.py)
+  recognition_cache_enabled = True
+  recognition_cache_path = 'recognition_cache.sqlite'
+  recognition_cache_ttl = 30 * 24 * 3600
+  recognition_cache_max_entries = 100000
+
+  # Images sent to Gemini are scaled to this long edge and re-encoded as JPEG at this quality
+  # (gemini_model.prepare_upload_image) unless they are already small JPEGs
+  gemini_image_prepare = True
+  gemini_image_max_long_edge = 1600
+  gemini_image_quality = 90
+
+  # Multi-image recognition (GeminiInference.recognize_top_k): the best gemini_top_k picker
+  # candidates go to Gemini in one request. None recognises one image per request
+  gemini_top_k = None
+
+  # Speculative recognition (recognition.recognize_speculative): this many top candidates are
+  # recognised concurrently, with at most speculative_max_calls Gemini calls between them.
+  # None recognises candidates one after another
+  speculative_candidates = None
+  speculative_max_calls = 6
+  speculative_workers = 8
+
+  # Per-API-key Gemini rate limits (key_dispatcher.py). A key that returns a quota error cools
+  # down for gemini_key_cooldown seconds, doubling on each consecutive error up to the max
+  gemini_requests_per_minute = 15
+  gemini_burst = 2
+  gemini_key_cooldown = 10
+  gemini_key_max_cooldown = 300
+
+  # Search result pages collect_links fetches at once. None fetches all max_pages
+  # concurrently, paced only by the per-host limiter below
+  collect_links_window = None
+
+  # Per-host politeness limiter (rate_limiter.py): requests per second per host. The rate is
+  # halved on 429/5xx responses and climbs back to these ceilings on success
+  rate_limit_default_rps = 2.0
+  rate_limit_host_rps = {'auctions.c.yimg.jp': 10.0, 'generativelanguage.googleapis.com': 10.0}
+  rate_limit_min_rps = 0.1
+  # Failed requests that the rate above does not slow (4xx other than 429) are retried after an
+  # exponential backoff capped at this many seconds
+  retry_backoff_max = 30.0
+
+  # Auction IDs processed in earlier runs (crawl_index.py). Listings older than this are stale
+  crawl_index_path = 'crawl_index.sqlite'
+  crawl_index_max_age = 7 * 24 * 3600
+
+  # Concurrent image download stage (Processor.load_images)
+  download_workers = 8
+  request_timeout = 15
+
+  # Short-lived listing HTML cache (Processor.fetch_listing_html): seconds and pages kept
+  listing_html_ttl = 300
+  listing_html_cache_size = 64
+
+  # HTML extraction backend (html_parsing.py): 'html.parser', 'lxml', 'selectolax' or 'stream'.
+  # Backends whose package is not installed fall back to 'html.parser'
+  html_parser = 'html.parser'
+
+  # Content-addressed image cache shared by the picker and Gemini (image_cache.py)
+  image_cache_dir = 'image_cache'
+  image_cache_max_bytes = 2 * 1024 ** 3
+  # New entries reach index.json at most this many seconds apart (and at exit)
+  image_cache_flush_interval = 30.0
+
+  # Pipelined executor (pipeline.py): workers per stage and size of the queues between stages.
+  # picker stays at 1 because the Keras model is not shared across threads; main.py raises
+  # gemini to the number of API keys unless --stage-concurrency sets it.
+  pipeline_concurrency = {'scrape': 4, 'fetch': 4, 'picker': 1, 'gemini': 1, 'price': 4}
+  pipeline_queue_size = 8
+
+  # Cross-listing batched picker (batching.py): longest a listing waits for its batch to fill,
+  # and picker stage workers used when batching, so enough listings are in flight to fill it
+  picker_max_wait = 0.2
+  batched_picker_workers = 8
+
 class Logs():
   runtimes = ''
 
@@ -27,20 +136,3 @@ class Logs():
     return runtimes_text
 
 
-class RuntimeMeta(type):
-    def __new__(cls, name, bases, dct):
-        for attr, value in dct.items():
-            if callable(value):
-                dct[attr] = cls.wrap_with_runtime(value)
-        return super(RuntimeMeta, cls).__new__(cls, name, bases, dct)
-
-    @staticmethod
-    def wrap_with_runtime(func):
-        def wrapper(self, *args, **kwargs):
-            start_time = time.time()
-            result = func(self, *args, **kwargs)
-            end_time = time.time()
-            print(f"Runtime of {func.__name__}: {end_time - start_time:.4f} seconds")
-            return result
-        return wrapper
-
@@ -0,0 +1,103 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from config import Config as cfg
+
+AUCTION_URL_RE = re.compile(r'^https?://page\.auctions\.yahoo\.co\.jp/jp/auction/([A-Za-z0-9]+)')
+
+
+def auction_id_from_url(url):
+    """
+    Parse the auction ID from a Yahoo Auctions listing URL.
+
+    Returns:
+        str or None: e.g. 'x1234567890' for https://page.auctions.yahoo.co.jp/jp/auction/x1234567890
+    """
+    match = AUCTION_URL_RE.match(url)
+    return match.group(1) if match else None
+
+
+class CrawlIndex():
+    """
+    Persistent index of auction IDs processed in earlier runs.
+
+    Each entry stores the listing URL, its result and when it was processed. Entries
+    older than max_age seconds are stale and get processed again, and the stored results
+    of the others are exported with each run (see stored_results). namespace keeps the
+    recognition runs of main.py apart from the label collection of collect_data.py.
+    """
+    def __init__(self, path=None, namespace='recognition', max_age=None):
+        self.path = path or cfg.crawl_index_path
+        self.namespace = namespace
+        self.max_age = cfg.crawl_index_max_age if max_age is None else max_age
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS auctions ("
+                "namespace TEXT NOT NULL, auction_id TEXT NOT NULL, url TEXT NOT NULL, result TEXT, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (namespace, auction_id))"
+            )
+
+    def known_ids(self, auction_ids):
+        """Return the subset of auction_ids that were processed within max_age."""
+        auction_ids = [a for a in set(auction_ids) if a]
+        cutoff = time.time() - self.max_age
+        known = set()
+        with self.lock:
+            for i in range(0, len(auction_ids), 500):
+                chunk = auction_ids[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT auction_id FROM auctions WHERE namespace = ? AND updated_at >= ? "
+                    f"AND auction_id IN ({', '.join('?' * len(chunk))})",
+                    [self.namespace, cutoff, *chunk]
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        return known
+
+    def filter_new(self, urls):
+        """Keep the URLs whose auction is new or stale. URLs without an auction ID are kept."""
+        known = self.known_ids(auction_id_from_url(url) for url in urls)
+        return [url for url in urls if auction_id_from_url(url) not in known]
+
+    def stored_results(self, urls):
+        """
+        Look up the results of URLs whose auction was processed within max_age.
+
+        Returns:
+            dict: url -> stored result, with 'url' set to the given URL.
+        """
+        ids = {auction_id_from_url(url): url for url in urls}
+        ids.pop(None, None)
+        auction_ids = list(ids)
+        cutoff = time.time() - self.max_age
+        results = {}
+        with self.lock:
+            for i in range(0, len(auction_ids), 500):
+                chunk = auction_ids[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT auction_id, result FROM auctions WHERE namespace = ? AND updated_at >= ? "
+                    f"AND auction_id IN ({', '.join('?' * len(chunk))})",
+                    [self.namespace, cutoff, *chunk]
+                ).fetchall()
+                for auction_id, result in rows:
+                    if result:
+                        results[ids[auction_id]] = {**json.loads(result), 'url': ids[auction_id]}
+        return results
+
+    def record(self, url, result):
+        auction_id = auction_id_from_url(url)
+        if auction_id is None:
+            return
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO auctions VALUES (?, ?, ?, ?, ?)",
+                              [self.namespace, auction_id, url, json.dumps(result, ensure_ascii=False), time.time()])
+
+    def get(self, auction_id):
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM auctions WHERE namespace = ? AND auction_id = ?",
+                                    [self.namespace, auction_id]).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
@@ -1,29 +1,48 @@
 import logging
 from config import Config as cfg 
-from config import RuntimeMeta
 
-import tensorflow as tf
 import numpy as np
-from tensorflow.data import Dataset
 
 import requests
-from PIL import Image
 from io import BytesIO
-from bs4 import BeautifulSoup
 import time
 import random
 import re
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, ProxyError
 
+from image_cache import get_image_cache
+from rate_limiter import backoff_delay, get_rate_limiter
+from html_parsing import get_html_backend
+from lazy_import import lazy_module
+from metrics import RuntimeMeta, get_metrics
+
+# TensorFlow and PIL are imported on first use, see lazy_import.py
+tf = lazy_module('tensorflow')
+Image = lazy_module('PIL.Image')
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def load_image(image_link):
+
+class ListingFetchError(Exception):
+    """Raised by Processor.parse_listing when the listing page could not be downloaded."""
+
+
+def load_image(image_link, session=None, timeout=None):
     """
     Load an image from a given link or file path.
     
     Args:
         image_link (str or np.ndarray): The image source (URL, file path, or numpy array).
+        session (requests.Session, optional): Session to reuse pooled connections with.
+        timeout (float, optional): Per-request timeout in seconds.
     
     Returns:
         PIL.Image.Image or None: The loaded image, or None if loading fails.
@@ -34,11 +53,12 @@ def load_image(image_link):
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
                 }
-                response = requests.get(image_link, headers=headers)
-                img = Image.open(BytesIO(response.content))
+                content = get_image_cache().fetch(image_link, session=session, headers=headers, timeout=timeout)
+                img = Image.open(BytesIO(content))
             except Exception as e:
                 print(image_link)
                 print(e)
+                get_image_cache().discard(image_link)
                 return None
         else:
             img = Image.open(image_link)
@@ -51,17 +71,18 @@ def load_image(image_link):
         img = img.convert('RGB')
     return img
 
-def encode_image(img):
+def encode_image(img, image_size=None):
     """
     Encode and normalize an image for model input.
     
     Args:
         img (PIL.Image.Image): The input image.
+        image_size (tuple, optional): Target (height, width). Defaults to cfg.image_size.
     
     Returns:
         np.ndarray: The encoded and normalized image array.
     """
-    img = img.resize(cfg.image_size)
+    img = img.resize(image_size or cfg.image_size)
     img = np.array(img)
     img = img.astype('float32')
     
@@ -74,17 +95,19 @@ def encode_image(img):
     
     return img
 
-def load_data(image_link):
+def load_data(image_link, session=None, timeout=None):
     """
     Load and preprocess an image from a given link.
     
     Args:
         image_link (str): The URL or file path of the image.
+        session (requests.Session, optional): Session to reuse pooled connections with.
+        timeout (float, optional): Per-request timeout in seconds.
     
     Returns:
         tf.Tensor or None: The preprocessed image tensor, or None if loading fails.
     """
-    img = load_image(image_link)
+    img = load_image(image_link, session=session, timeout=timeout)
     if img is None:
         return None
     img = encode_image(img)
@@ -93,14 +116,187 @@ def load_data(image_link):
     img = tf.convert_to_tensor(img)
     return img
 
+def image_digest(image_link):
+    """
+    Content hash of an image, as used by the image cache.
+    
+    Args:
+        image_link (str): The URL or file path of the image.
+    
+    Returns:
+        str or None: sha256 hex digest, or None for a URL that is not in the image cache.
+    """
+    if image_link.startswith("http"):
+        return get_image_cache().digest(image_link)
+    try:
+        with open(image_link, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+# Formats tf.io.decode_image reads natively; anything else is re-encoded to PNG on load
+TF_DECODABLE_FORMATS = ('JPEG', 'PNG', 'GIF', 'BMP')
+
+def load_image_bytes(image_link, session=None, timeout=None):
+    """
+    Load the raw encoded bytes of an image without decoding it.
+    
+    The header is parsed to reject non-images early, so a broken download cannot fail a
+    whole batch later inside the TF graph.
+    
+    Args:
+        image_link (str): The URL or file path of the image.
+        session (requests.Session, optional): Session to reuse pooled connections with.
+        timeout (float, optional): Per-request timeout in seconds.
+    
+    Returns:
+        bytes or None: Encoded image bytes TF can decode, or None if loading fails.
+    """
+    try:
+        if image_link.startswith("http"):
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+            }
+            content = get_image_cache().fetch(image_link, session=session, headers=headers, timeout=timeout)
+        else:
+            with open(image_link, 'rb') as f:
+                content = f.read()
+
+        img = Image.open(BytesIO(content))
+        if img.format not in TF_DECODABLE_FORMATS:
+            buffer = BytesIO()
+            img.convert('RGB').save(buffer, format='PNG')
+            content = buffer.getvalue()
+        return content
+    except Exception as e:
+        logging.error(f"Error loading image bytes {image_link}: {e}")
+        if image_link.startswith("http"):
+            get_image_cache().discard(image_link)
+        return None
+
+def decode_and_resize(image_bytes, image_size=None):
+    """
+    Decode encoded image bytes inside the TF graph and resize them.
+    
+    Args:
+        image_bytes (tf.Tensor): Scalar tf.string tensor with JPEG/PNG/GIF/BMP bytes.
+        image_size (tuple, optional): Target (height, width). Defaults to cfg.image_size.
+    
+    Returns:
+        tf.Tensor: uint8 image of shape (*image_size, 3).
+    """
+    img = tf.io.decode_image(image_bytes, channels=3, expand_animations=False)
+    img = tf.image.resize(img, image_size or cfg.image_size, method='bicubic')
+    return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8)
+
+def pil_decode_and_resize(image_bytes, image_size=None):
+    """
+    Decode and resize encoded image bytes with PIL, as the 'pil' preprocess mode does.
+    
+    Training runs it inside tf.data through tf.numpy_function, so images are resized the
+    same way as at inference.
+    
+    Args:
+        image_bytes (bytes): Encoded image.
+        image_size (tuple, optional): Target size, passed to PIL like encode_image does.
+            Defaults to cfg.image_size.
+    
+    Returns:
+        np.ndarray: uint8 image of shape (*image_size, 3).
+    """
+    img = Image.open(BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img.resize(tuple(image_size or cfg.image_size)), dtype=np.uint8)
+
+def resize_image_bytes(image_bytes, image_size=None, preprocess_mode=None):
+    """
+    Eagerly decode and resize encoded image bytes the way preprocess_mode does at inference.
+    
+    Returns:
+        np.ndarray: uint8 image of shape (*image_size, 3).
+    """
+    if (preprocess_mode or cfg.preprocess_mode) == 'graph':
+        return decode_and_resize(image_bytes, image_size).numpy()
+    return pil_decode_and_resize(bytes(image_bytes), image_size)
+
+def normalize_images(images):
+    """
+    Scale uint8 images to the [0, 1] float32 range the picker was trained on.
+    
+    Args:
+        images (tf.Tensor): uint8 image or batch of images.
+    
+    Returns:
+        tf.Tensor: float32 tensor of the same shape.
+    """
+    return tf.cast(images, tf.float32) / 255.0
+
+def iter_label_files(dataset_path):
+    """
+    Stream per-listing picker labels, as written by collect_data.py.
+    
+    Zip archives are read member by member without extracting them.
+    
+    Args:
+        dataset_path (str): A folder of .json label files, or a zip archive of them
+            (e.g. the predicted_data export).
+    
+    Yields:
+        tuple: (listing_id, {image_link: label}) in file name order. listing_id is the
+            file name without its .html.json/.json suffix, e.g. 'n1051868870'.
+    """
+    def listing_id(name):
+        name = os.path.basename(name)
+        return name[:-len('.html.json')] if name.endswith('.html.json') else name[:-len('.json')]
+
+    if zipfile.is_zipfile(dataset_path):
+        with zipfile.ZipFile(dataset_path) as archive:
+            for name in sorted(n for n in archive.namelist() if n.endswith('.json')):
+                with archive.open(name) as f:
+                    yield listing_id(name), json.load(f)
+        return
+
+    json_files = []
+    for root, dirs, files in os.walk(dataset_path):
+        for file in files:
+            if file.endswith('.json'):
+                json_files.append(os.path.join(root, file))
+
+    for json_file in sorted(json_files):
+        with open(json_file, 'r') as f:
+            yield listing_id(json_file), json.load(f)
+
+def read_label_files(dataset_path):
+    """
+    Read per-listing picker labels from a folder or zip archive (see iter_label_files).
+    
+    Returns:
+        list: One {image_link: label} dict per listing, in file name order.
+    """
+    return [labels for _, labels in iter_label_files(dataset_path)]
+
 class Processor(metaclass=RuntimeMeta):
     """
     A class for processing web pages and images for model input.
     """
-    def __init__(self, image_size, batch_size):
+    def __init__(self, image_size, batch_size, download_workers=None, preprocess_mode=None):
         self.image_size = image_size
         self.batch_size = batch_size
+        self.preprocess_mode = preprocess_mode or cfg.preprocess_mode
+        if self.preprocess_mode not in ('pil', 'graph'):
+            raise ValueError(f"Unknown preprocess mode '{self.preprocess_mode}'. Expected 'pil' or 'graph'")
+        self.download_workers = download_workers or cfg.download_workers
         self.session = requests.Session()
+        self.html_backend = get_html_backend()
+        # Short-lived cache of listing HTML so each listing page is fetched once per run step
+        self.html_cache = {}
+        self.html_cache_lock = threading.Lock()
+        # Keep enough keep-alive connections per host for every download worker
+        adapter = HTTPAdapter(pool_connections=self.download_workers, pool_maxsize=self.download_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.download_pool = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix='image-download')
         self.user_agents = self.generate_similar_user_agents()
         self.headers_list = self.generate_headers_list()
         self.proxies = [
@@ -163,7 +359,7 @@ class Processor(metaclass=RuntimeMeta):
             headers_list.append(headers)
         return headers_list
 
-    def get_page_content(self, url, verbose=0, max_retries=5):
+    def get_page_content(self, url, verbose=0, max_retries=5, cancel_event=None):
         """
         Retrieve and parse product information from a given URL.
         
@@ -171,6 +367,8 @@ class Processor(metaclass=RuntimeMeta):
             url (str): The URL of the page to scrape.
             verbose (int): Verbosity level for logging.
             max_retries (int): Maximum number of retry attempts.
+            cancel_event (threading.Event, optional): Once set, no further request is sent and
+                rate_limiter.RequestCancelled is raised.
         
         Yields:
             tuple: A pair of (image_src, product_link) for each product found.
@@ -178,33 +376,23 @@ class Processor(metaclass=RuntimeMeta):
         logging.info(f"Getting page content from: {url}")
 
         for attempt in range(max_retries):
-            headers = random.choice(self.headers_list)
+            headers = dict(random.choice(self.headers_list))
             headers['User-Agent'] = random.choice(self.user_agents)  # Use the new method here
             
             try:
-                delay = (2 ** attempt) + random.random()
-                time.sleep(delay)
-                
-                response = self.session.get(url, headers=headers, timeout=10)
+                # The host rate limiter paces requests and backs off after 429/5xx responses
+                response = get_rate_limiter().get(self.session, url, cancel_event=cancel_event, headers=headers, timeout=10)
                 response.raise_for_status()
+                get_metrics().inc('search_pages_fetched')
                 
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Try different selectors to find product items
-                product_items = (
-                    soup.select('li.Product') or
-                    soup.select('div.ProductTile') or
-                    soup.select('div[class*="product"]')
-                )
+                product_items = self.html_backend.search_items(response.content)
                 
                 if not product_items:
                     logging.warning("No product items found on the page.")
                 
-                for item in product_items:
-                    link = item.select_one('a[href^="https://"]')
-                    img = item.select_one('img[src^="https://"]')
+                for img, link in product_items:
                     if link and img:
-                        yield img.get('src'), link.get('href')
+                        yield img, link
                     else:
                         logging.warning(f"Found incomplete product item: link={link}, img={img}")
                 
@@ -212,144 +400,250 @@ class Processor(metaclass=RuntimeMeta):
                 break
             
             except RequestException as e:
+                get_metrics().inc('search_page_retries')
                 logging.error(f"Attempt {attempt + 1}/{max_retries} failed: {e}")
                 logging.error(f"Headers used: {headers}")
                 if attempt == max_retries - 1:
                     logging.error(f"Failed to retrieve the webpage after {max_retries} attempts: {e}")
                     return
+                time.sleep(backoff_delay(attempt))
 
-    def parse_images_from_page(self, page_url, max_retries=5):
+    def fetch_listing_html(self, page_url, max_retries=5):
         """
-        Extract image links from a given page URL, focusing on the "ProductImage__images" class.
+        Download a listing page, reusing a copy fetched within the last cfg.listing_html_ttl seconds.
         
         Args:
-            page_url (str): The URL of the page to parse.
+            page_url (str): The URL of the listing page.
+            max_retries (int): Maximum number of retry attempts.
         
         Returns:
-            list: A list of unique image URLs found within the "ProductImage__images" class.
+            bytes or None: The raw HTML, or None if every attempt failed.
         """
-        logging.info(f"Parsing images from page: {page_url}")
+        now = time.monotonic()
+        with self.html_cache_lock:
+            cached = self.html_cache.get(page_url)
+            if cached is not None and cached[0] > now:
+                get_metrics().inc('listing_html_cache_hits')
+                return cached[1]
 
         for attempt in range(max_retries):
             headers = random.choice(self.headers_list)
             
             try:
-                time.sleep(random.uniform(1, 2))
-                response = self.session.get(page_url, headers=headers, timeout=15)
+                response = get_rate_limiter().get(self.session, page_url, headers=headers, timeout=15)
                 response.raise_for_status()
+                get_metrics().inc('listing_pages_fetched')
                 break
             except requests.RequestException as e:
+                get_metrics().inc('listing_page_retries')
                 logging.error(f"Attempt {attempt + 1}/{max_retries} failed: {e}")
                 logging.error(f"Headers used: {headers}")
                 if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + random.random()
+                    wait_time = backoff_delay(attempt)
                     logging.warning(f"Request failed. Retrying in {wait_time:.2f} seconds...")
                     time.sleep(wait_time)
                 else:
                     logging.error(f"Failed to retrieve the webpage after {max_retries} attempts: {e}")
-                    return []
+                    return None
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        image_links = []
+        now = time.monotonic()
+        with self.html_cache_lock:
+            # Drop expired pages, then the oldest ones, to keep the cache short-lived and small
+            for url in [u for u, (expires_at, _) in self.html_cache.items() if expires_at <= now]:
+                del self.html_cache[url]
+            while len(self.html_cache) >= cfg.listing_html_cache_size:
+                del self.html_cache[next(iter(self.html_cache))]
+            self.html_cache[page_url] = (now + cfg.listing_html_ttl, response.content)
+        return response.content
 
-        # Find images in the "ProductImage__images" class
-        product_image_elements = soup.find_all(class_="ProductImage__images")
+    def parse_listing(self, page_url, max_retries=5):
+        """
+        Fetch a listing page once and extract everything the pipeline needs from it.
         
-        if product_image_elements:
-            for element in product_image_elements:
-                imgs = element.find_all('img')
-                for img in imgs:
-                    src = img.get('src') or img.get('data-src')
-                    if src:
-                        image_links.append(src)
-            logging.info(f"Found {len(image_links)} images")
-        else:
-            logging.warning("No 'ProductImage__images' class found on the page")
-
-        # Process and clean up image links
-        cleaned_links = []
-        for src in image_links:
-            if src.startswith('//'):
-                src = 'https:' + src
-            elif not src.startswith('http'):
-                src = 'https://auctions.yahoo.co.jp' + src
-            cleaned_links.append(src)
-
-        unique_links = list(set(cleaned_links))
-        logging.info(f"Found {len(unique_links)} unique image links")
+        Args:
+            page_url (str): The URL of the listing page.
+            max_retries (int): Maximum number of retry attempts.
+        
+        Returns:
+            dict: 'url', 'image_links' (unique, from the "ProductImage__images" class),
+                'price', 'title' and 'seller' ('N/A' when missing).
+        
+        Raises:
+            ListingFetchError: If every attempt to download the page failed, so a network
+                error is not mistaken for a listing without images.
+        """
+        logging.info(f"Parsing listing page: {page_url}")
+
+        html = self.fetch_listing_html(page_url, max_retries=max_retries)
+        if html is None:
+            raise ListingFetchError(f"Failed to fetch listing page {page_url}")
+
+        listing = {'url': page_url, **self.html_backend.listing(html)}
+        logging.info(f"Found {len(listing['image_links'])} unique image links")
         
-        if not unique_links:
+        if not listing['image_links']:
             logging.warning("No images found. Dumping HTML for inspection.")
-            with open('page_dump.html', 'w', encoding='utf-8') as f:
-                f.write(soup.prettify())
+            with open('page_dump.html', 'wb') as f:
+                f.write(html)
             logging.warning("HTML dumped to page_dump.html")
+
+        return listing
+
+    def parse_images_from_page(self, page_url, max_retries=5):
+        """
+        Extract image links from a given page URL, focusing on the "ProductImage__images" class.
+        
+        Args:
+            page_url (str): The URL of the page to parse.
         
-        return unique_links
+        Returns:
+            list: A list of unique image URLs found within the "ProductImage__images" class,
+                empty if the page could not be fetched.
+        """
+        try:
+            return self.parse_listing(page_url, max_retries=max_retries)['image_links']
+        except ListingFetchError as e:
+            logging.error(e)
+            return []
 
     def load_product_info(self, url):
         """
         Load product information from a given URL.
         
+        The page comes from the short-lived HTML cache when it was just parsed for images.
+        
         Args:
             url (str): The URL of the product page.
         
         Returns:
             dict: A dictionary containing product information (e.g., price).
         """
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            return_data = {}
-            # Extract the price information from the product page
-            price_elem = soup.find('dd', class_='Price__value')
-            return_data['price'] = price_elem.text.strip() if price_elem else 'N/A'
-            return return_data
-        else:
-            print(f'Failed to retrieve the webpage. Status code: {response.status_code}')
+        listing = self.parse_listing(url)
+        return {'price': listing['price']}
 
-    def build_dataset(self, image_links):
+    def load_one(self, image_link):
         """
-        Build a TensorFlow dataset from a list of image links.
+        Load a single image for the current preprocess mode, or None if it fails.
+        
+        Local files raise instead of returning None, e.g. when missing or not an image,
+        so the error is logged here and the link skipped like a failed download.
+        """
+        load_fn = load_image_bytes if self.preprocess_mode == 'graph' else load_data
+        try:
+            return load_fn(image_link, session=self.session)
+        except Exception as e:
+            logging.error(f"Error loading image {image_link}: {e}")
+            return None
+
+    def load_images(self, image_links):
+        """
+        Download and preprocess images concurrently on the download pool.
+        
+        Every link is fetched on its own worker with a per-request timeout, so the
+        whole batch takes about as long as its slowest image. Failed links are logged
+        and skipped without holding back the rest of the batch.
+        
+        In 'graph' preprocess mode images stay as encoded bytes; decoding, resizing and
+        normalisation happen later inside the tf.data pipeline built by batch_images.
         
         Args:
             image_links (list): A list of image URLs or file paths.
         
         Returns:
-            tf.data.Dataset: A TensorFlow dataset containing the processed images.
+            list: (image_link, image) pairs for the images that loaded, in input order.
+                image is a float32 tf.Tensor in 'pil' mode and encoded bytes in 'graph' mode.
         """
-        images = []
-        for i, image_link in enumerate(image_links):
-            img = load_data(image_link)
-            if img is not None:
-                images.append(img)
-            if (i + 1) % 10 == 0:
-                logging.info(f"Processed {i + 1}/{len(image_links)} images")
+        images = self.download_pool.map(self.load_one, image_links)
+
+        loaded, failed_links = [], []
+        for image_link, img in zip(image_links, images):
+            if img is None:
+                failed_links.append(image_link)
+            else:
+                loaded.append((image_link, img))
+
+        logging.info(f"Loaded {len(loaded)}/{len(image_links)} images")
+        get_metrics().inc('images_loaded', len(loaded))
+        get_metrics().inc('images_failed', len(failed_links))
+        if failed_links:
+            logging.warning(f"Failed to load {len(failed_links)} images: {failed_links}")
+        return loaded
 
+    def batch_images(self, images):
+        """
+        Build a batched TensorFlow dataset from images returned by load_images.
+        
+        Args:
+            images (list): Preprocessed image tensors, or encoded bytes in 'graph' mode.
+        
+        Returns:
+            tf.data.Dataset: A TensorFlow dataset containing the processed images.
+        """
         if not images:
             logging.warning("No valid images found. Returning empty dataset.")
-            return Dataset.from_tensor_slices([]).batch(1)  # Return an empty dataset
+            return tf.data.Dataset.from_tensor_slices([]).batch(1)  # Return an empty dataset
 
-        dataset = Dataset.from_tensor_slices(images)
+        if self.preprocess_mode == 'graph':
+            dataset = tf.data.Dataset.from_tensor_slices(images)
+            dataset = dataset.map(lambda b: decode_and_resize(b, self.image_size), num_parallel_calls=tf.data.AUTOTUNE)
+            dataset = dataset.batch(self.batch_size)
+            # Normalise once per batch so the float32 copy only exists for the batch in flight
+            dataset = dataset.map(normalize_images, num_parallel_calls=tf.data.AUTOTUNE)
+            return dataset.prefetch(tf.data.AUTOTUNE)
+
+        dataset = tf.data.Dataset.from_tensor_slices(images)
         
         # Add error checking
         try:
             # Check if the dataset is empty
             if tf.data.experimental.cardinality(dataset).numpy() == 0:
                 logging.warning("Dataset is empty. Returning empty dataset.")
-                return Dataset.from_tensor_slices([]).batch(1)
+                return tf.data.Dataset.from_tensor_slices([]).batch(1)
             
             # Try to fetch the first element
             next(iter(dataset))
         except Exception as e:
             logging.error(f"Error in dataset: {e}")
             logging.warning("Returning empty dataset.")
-            return Dataset.from_tensor_slices([]).batch(1)
+            return tf.data.Dataset.from_tensor_slices([]).batch(1)
 
         dataset = dataset.batch(self.batch_size)
         dataset = dataset.prefetch(tf.data.AUTOTUNE)
         return dataset
 
+    def stack_images(self, images, image_size=None):
+        """
+        Stack up to batch_size images from load_images into one model-ready batch.
+        
+        Args:
+            images (list): Preprocessed image tensors, or encoded bytes in 'graph' mode.
+            image_size (tuple, optional): Size to stack the images at, e.g. the low
+                resolution of the picker cascade. Defaults to self.image_size.
+        
+        Returns:
+            tf.Tensor: float32 batch of shape (len(images), *image_size, 3).
+        """
+        image_size = tuple(image_size or self.image_size)
+        if self.preprocess_mode == 'graph':
+            return normalize_images(tf.stack([decode_and_resize(b, image_size) for b in images]))
+        batch = tf.stack(images)
+        if image_size != tuple(self.image_size):
+            batch = tf.image.resize(batch, image_size, method='area')
+        return batch
+
+    def build_dataset(self, image_links):
+        """
+        Build a TensorFlow dataset from a list of image links.
+        
+        Args:
+            image_links (list): A list of image URLs or file paths.
+        
+        Returns:
+            tf.data.Dataset: A TensorFlow dataset containing the processed images.
+        """
+        loaded = self.load_images(image_links)
+        return self.batch_images([img for _, img in loaded])
+
     def __call__(self, *args, **kwargs):
         """
         Make the class callable, equivalent to calling build_dataset.
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+from config import Config as cfg
+from dataprocessor import Processor, iter_label_files, load_image_bytes, resize_image_bytes, tf
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MANIFEST_NAME = 'manifest.json'
+SPLITS = ('train', 'eval')
+ENCODINGS = ('jpeg', 'raw')
+
+
+def listing_split(listing_id, eval_split):
+    """Deterministically assign a listing to 'train' or 'eval', so rebuilds keep the same split."""
+    bucket = int(hashlib.sha1(listing_id.encode()).hexdigest()[:8], 16) / 16 ** 8
+    return 'eval' if bucket < eval_split else 'train'
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+
+class ShardWriter():
+    """Writes the TFRecord shards of one split, starting a new file every shard_size examples."""
+    def __init__(self, output_dir, split, shard_size):
+        self.output_dir = output_dir
+        self.split = split
+        self.shard_size = shard_size
+        self.shards = []
+        self.writer = None
+
+    def write(self, serialized, label):
+        if self.writer is None or self.shards[-1]['examples'] >= self.shard_size:
+            self.close()
+            file = f"{self.split}-{len(self.shards):05d}.tfrecord"
+            self.writer = tf.io.TFRecordWriter(os.path.join(self.output_dir, file))
+            self.shards.append({'file': file, 'examples': 0, 'positives': 0})
+        self.writer.write(serialized)
+        self.shards[-1]['examples'] += 1
+        self.shards[-1]['positives'] += int(label)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def build_shards(dataset_path, output_dir, image_size=None, shard_size=None, eval_split=0.1, encoding='jpeg',
+                 chunk_size=256):
+    """
+    Build sharded TFRecord files of pre-resized images from per-listing label files.
+
+    The label archive is streamed without extracting it. Every image link is downloaded
+    once (through the image cache, on the processor's download pool), resized to
+    image_size as cfg.preprocess_mode does at inference and stored with its label,
+    listing ID and link. Listings are split into
+    'train' and 'eval' by a hash of their ID. manifest.json describes the result.
+
+    Args:
+        dataset_path (str): Label folder or zip archive, e.g. predicted_data-*.zip.
+        output_dir (str): Directory to write the shards and manifest to.
+        image_size (tuple, optional): Stored (height, width). Defaults to cfg.image_size.
+        shard_size (int, optional): Examples per shard. Defaults to cfg.dataset_shard_size.
+        eval_split (float): Fraction of listings written to the 'eval' split.
+        encoding (str): 'jpeg' stores resized uint8 images as quality-95 JPEG, 'raw' stores
+            the uint8 pixels themselves (larger, but no decoding when reading).
+        chunk_size (int): Images downloaded concurrently before they are written.
+
+    Returns:
+        dict: The manifest.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}'. Expected one of {ENCODINGS}")
+    image_size = tuple(image_size or cfg.image_size)
+    shard_size = shard_size or cfg.dataset_shard_size
+    os.makedirs(output_dir, exist_ok=True)
+
+    processor = Processor(image_size, cfg.batch_size)
+    writers = {split: ShardWriter(output_dir, split, shard_size) for split in SPLITS}
+    listings = {split: 0 for split in SPLITS}
+    seen, failed = set(), []
+
+    def examples():
+        for listing_id, labels in iter_label_files(dataset_path):
+            split = listing_split(listing_id, eval_split)
+            listings[split] += 1
+            for image_link, label in labels.items():
+                # Links shared between listings are downloaded and stored once
+                if image_link not in seen:
+                    seen.add(image_link)
+                    yield split, listing_id, image_link, int(label)
+
+    def write_chunk(chunk):
+        contents = processor.download_pool.map(lambda e: load_image_bytes(e[2], session=processor.session), chunk)
+        for (split, listing_id, image_link, label), content in zip(chunk, contents):
+            if content is None:
+                failed.append(image_link)
+                continue
+            # Resized like the picker's inference path, so training sees the same pixels
+            img = resize_image_bytes(content, image_size, processor.preprocess_mode)
+            image = tf.io.encode_jpeg(img, quality=95).numpy() if encoding == 'jpeg' else img.tobytes()
+            example = tf.train.Example(features=tf.train.Features(feature={
+                'image': _bytes_feature(image),
+                'label': _int64_feature(label),
+                'listing_id': _bytes_feature(listing_id.encode()),
+                'image_link': _bytes_feature(image_link.encode()),
+            }))
+            writers[split].write(example.SerializeToString(), label)
+
+    chunk = []
+    try:
+        for example in examples():
+            chunk.append(example)
+            if len(chunk) >= chunk_size:
+                write_chunk(chunk)
+                chunk = []
+                logging.info(f"Processed {len(seen)} images ({len(failed)} failed)")
+        if chunk:
+            write_chunk(chunk)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    manifest = {
+        'source': os.path.basename(dataset_path.rstrip('/')),
+        'created': time.time(),
+        'image_size': list(image_size),
+        'encoding': encoding,
+        'preprocess_mode': processor.preprocess_mode,
+        'eval_split': eval_split,
+        'failed_images': len(failed),
+        'splits': {split: {
+            'listings': listings[split],
+            'examples': sum(s['examples'] for s in writers[split].shards),
+            'positives': sum(s['positives'] for s in writers[split].shards),
+            'shards': writers[split].shards,
+        } for split in SPLITS},
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logging.info(f"Wrote {sum(manifest['splits'][s]['examples'] for s in SPLITS)} examples to {output_dir} "
+                 f"({len(failed)} images failed to load)")
+    return manifest
+
+
+def read_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST_NAME), 'r') as f:
+        return json.load(f)
+
+
+def load_shards(shard_dir, split='train'):
+    """
+    Read one split of a shard directory written by build_shards.
+
+    Shards are read one after another, in order, from local disk.
+
+    Args:
+        shard_dir (str): Directory with manifest.json and the shards.
+        split (str): 'train' or 'eval'.
+
+    Returns:
+        tf.data.Dataset: (uint8 image, float32 label, listing_id) examples.
+    """
+    manifest = read_manifest(shard_dir)
+    height, width = manifest['image_size']
+    encoding = manifest['encoding']
+    files = [os.path.join(shard_dir, shard['file']) for shard in manifest['splits'][split]['shards']]
+
+    features = {
+        'image': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+        'listing_id': tf.io.FixedLenFeature([], tf.string),
+    }
+
+    def parse(serialized):
+        example = tf.io.parse_single_example(serialized, features)
+        if encoding == 'jpeg':
+            image = tf.io.decode_jpeg(example['image'], channels=3)
+        else:
+            image = tf.io.decode_raw(example['image'], tf.uint8)
+        image = tf.reshape(image, (height, width, 3))
+        return image, tf.cast(example['label'], tf.float32), example['listing_id']
+
+    dataset = tf.data.TFRecordDataset(files, buffer_size=8 * 1024 ** 2)
+    return dataset.map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+
+
+def parse_args():
+    """
+    Main usage Example:
+
+        python dataset_shards.py --dataset-path predicted_data-20240821T151905Z-001.zip --output-dir picker_shards
+
+    """
+    parser = argparse.ArgumentParser(description="Build sharded TFRecord picker datasets from label files")
+
+    parser.add_argument('--dataset-path', type=str, required=True, help="Folder or zip archive of per-listing JSON label files")
+    parser.add_argument('--output-dir', type=str, default=cfg.dataset_shard_dir, help="Where to write the shards and manifest")
+    parser.add_argument('--shard-size', type=int, default=None, help="Examples per shard (default from config)")
+    parser.add_argument('--eval-split', type=float, default=0.1, help="Fraction of listings written to the eval split")
+    parser.add_argument('--encoding', choices=ENCODINGS, default='jpeg', help="How resized images are stored")
+
+    args = parser.parse_args()
+
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    build_shards(args.dataset_path, args.output_dir, shard_size=args.shard_size, eval_split=args.eval_split,
+                 encoding=args.encoding)
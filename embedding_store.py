@@ -0,0 +1,98 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from config import Config as cfg
+from metrics import get_metrics
+
+
+def checkpoint_id(weights_path):
+    """
+    Short identifier of a weights file from its absolute path, size and modification time.
+
+    Replacing or retraining the checkpoint changes it without reading the whole file.
+    A missing file gets 'missing', so nothing stored under a real checkpoint is reused.
+    """
+    try:
+        st = os.stat(weights_path)
+    except OSError:
+        return 'missing'
+    key = f"{os.path.abspath(weights_path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+class EmbeddingStore():
+    """
+    Persistent store of pooled picker backbone embeddings keyed by image content hash.
+
+    An image's embedding changes with the checkpoint, the backbone input size and the
+    preprocessing. model_tag records all three, and rows written under another tag are
+    ignored.
+    """
+    def __init__(self, path=None, model_tag=None, weights_path=None):
+        self.path = path or cfg.embedding_store_path
+        self.model_tag = model_tag or (f"{cfg.image_size[0]}x{cfg.image_size[1]}-{cfg.preprocess_mode}"
+                                       f"-{checkpoint_id(weights_path or cfg.model_path)}")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "digest TEXT NOT NULL, model_tag TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (digest, model_tag))"
+            )
+
+    def get_many(self, digests):
+        """
+        Look up stored embeddings.
+
+        Args:
+            digests (iterable): Image content hashes.
+
+        Returns:
+            dict: digest -> float32 np.ndarray for the digests that are stored.
+        """
+        digests = list(set(digests))
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(digests), 500):
+                chunk = digests[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model_tag = ? AND digest IN ({', '.join('?' * len(chunk))})",
+                    [self.model_tag, *chunk]
+                ).fetchall()
+                found.update({digest: np.frombuffer(vector, dtype=np.float32) for digest, vector in rows})
+            self.hits += len(found)
+            self.misses += len(digests) - len(found)
+        get_metrics().inc('embedding_cache_hits', len(found))
+        get_metrics().inc('embedding_cache_misses', len(digests) - len(found))
+        return found
+
+    def put_many(self, embeddings):
+        """
+        Store embeddings.
+
+        Args:
+            embeddings (dict): digest -> np.ndarray.
+        """
+        rows = [(digest, self.model_tag, np.asarray(vector, dtype=np.float32).tobytes())
+                for digest, vector in embeddings.items()]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings WHERE model_tag = ?", [self.model_tag]).fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+        }
@@ -0,0 +1,99 @@
+import argparse
+import logging
+import random
+
+import numpy as np
+
+from config import Config as cfg
+from dataprocessor import load_data, read_label_files, tf
+from picker_model import build_model
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def calibration_images(dataset_path, num_images, seed=0):
+    """
+    Yield preprocessed picker inputs for int8 calibration.
+
+    Positive (label) photos are rare, so half of the sample is taken from them when the
+    dataset has enough, to keep their activation ranges represented.
+    """
+    positives, negatives = [], []
+    for listing in read_label_files(dataset_path):
+        for image_link, label in listing.items():
+            (positives if label else negatives).append(image_link)
+
+    rng = random.Random(seed)
+    sample = rng.sample(positives, min(len(positives), num_images // 2))
+    sample += rng.sample(negatives, min(len(negatives), num_images - len(sample)))
+    rng.shuffle(sample)
+
+    yielded = 0
+    for image_link in sample:
+        img = load_data(image_link)
+        if img is None:
+            continue
+        yielded += 1
+        # The converter expects one list of model inputs per sample
+        yield [np.expand_dims(np.asarray(img, dtype=np.float32), 0)]
+    logging.info(f"Calibrated on {yielded}/{len(sample)} images")
+
+
+def export_tflite(weights_path, output_path, dataset_path=None, num_calibration_images=200):
+    """
+    Convert the picker checkpoint to a quantised TFLite model.
+
+    With a calibration dataset, weights and activations are quantised to int8 (ops without
+    an int8 kernel stay float) while the model keeps float32 input and output, so it takes
+    the same preprocessed images as the Keras model. Without one, only the weights are
+    quantised (dynamic range quantisation).
+
+    Args:
+        weights_path (str): Keras weights, e.g. cfg.model_path.
+        output_path (str): Where to write the .tflite file.
+        dataset_path (str, optional): Label folder or zip to draw calibration images from.
+        num_calibration_images (int): Images used for calibration.
+
+    Returns:
+        int: Size of the written model in bytes.
+    """
+    model = build_model(1)
+    model.load_weights(weights_path)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if dataset_path is not None:
+        converter.representative_dataset = lambda: calibration_images(dataset_path, num_calibration_images)
+    else:
+        logging.warning("No calibration data given. Falling back to dynamic range quantisation.")
+
+    tflite_model = converter.convert()
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+    logging.info(f"Wrote {output_path} ({len(tflite_model) / 1024 ** 2:.1f} MiB)")
+    return len(tflite_model)
+
+
+def parse_args():
+    """
+    Main usage Example: 
+    
+        python export_model.py --calibration-data predicted_data-20240821T151905Z-001.zip
+        
+    """
+    parser = argparse.ArgumentParser(description="Export the picker checkpoint to an int8 TFLite model")
+
+    parser.add_argument('--weights', type=str, default=cfg.model_path, help="Keras weights to convert")
+    parser.add_argument('--output', type=str, default=cfg.tflite_model_path, help="Where to write the .tflite model")
+    parser.add_argument('--calibration-data', type=str, default=None, help="Folder or zip archive of label files to calibrate int8 activations on")
+    parser.add_argument('--num-calibration-images', type=int, default=200, help="Number of calibration images")
+
+    args = parser.parse_args()
+
+    return args.weights, args.output, args.calibration_data, args.num_calibration_images
+
+if __name__ == '__main__':
+    weights_path, output_path, dataset_path, num_calibration_images = parse_args()
+
+    export_tflite(weights_path, output_path, dataset_path, num_calibration_images)
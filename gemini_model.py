@@ -1,21 +1,194 @@
 # ! pip install -q google-generativeai
 
-import google.generativeai as genai
 from pathlib import Path
-from time import sleep
-import random
 import logging
 import time
 import json
 import os
-from PIL import Image
-import requests
 import re
 import io
+import hashlib
+import threading
+
+from config import Config as cfg
+from lazy_import import lazy_module
+from metrics import get_metrics, timed
+from image_cache import get_image_cache
+from key_dispatcher import KeyDispatcher
+from rate_limiter import get_rate_limiter
+from recognition_cache import RecognitionCache
+
+genai = lazy_module('google.generativeai')
+glm = lazy_module('google.ai.generativelanguage')
+Image = lazy_module('PIL.Image')
+ImageOps = lazy_module('PIL.ImageOps')
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+GEMINI_API_HOST = 'generativelanguage.googleapis.com'
+
+# google-generativeai releases whose GenerativeModel keeps its service client in _client,
+# checked before bind_model_client relies on it: [first, end)
+PER_MODEL_CLIENT_VERSIONS = ((0, 3), (0, 9))
+
+
+def per_model_clients_supported():
+  version = tuple(int(part) for part in re.findall(r'\d+', getattr(genai, '__version__', ''))[:2])
+  return PER_MODEL_CLIENT_VERSIONS[0] <= version < PER_MODEL_CLIENT_VERSIONS[1]
+
+
+def bind_model_client(model, api_key):
+  """
+    Give model a service client of its own that authenticates with api_key.
+
+    genai.configure() is process-wide and GenerativeModel takes no client or key, so this
+    replaces the model's private _client. Callers check per_model_clients_supported() first.
+  """
+  model._client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+  return model
+
+class RecognitionCancelled(Exception):
+  """Raised inside a recognition whose RequestBudget was cancelled or spent."""
+
+
+class SpendCapReached(RecognitionCancelled):
+  """Raised inside a recognition that stopped because its RequestBudget was spent."""
+
+
+class RequestBudget():
+  """
+    API call allowance shared by the recognitions of one listing.
+
+    Every Gemini request takes one call from the budget before it is sent and gives it
+    back with refund() if it got no response (not sent after all, quota rejection or any
+    other error), so only answered requests count and at most max_calls are answered.
+
+    Concurrent recognitions each hold a claim() with their candidate's rank (0 is best).
+    A lower-ranked claim waits rather than take the calls still reserved for better-ranked
+    running ones (one each), and a claim that runs out of calls cancels every lower-ranked
+    one, so the best candidates have first claim on the budget. Out of calls, take() raises
+    SpendCapReached; after cancel(), or for a cancelled rank, RecognitionCancelled.
+  """
+  def __init__(self, max_calls=None):
+    self.max_calls = max_calls
+    self.calls = 0
+    self.active = set()  # ranks of the claims still running
+    self.cutoff = None  # claims ranked at or below this are cancelled
+    self.changed = threading.Condition()
+
+  def claim(self, rank):
+    with self.changed:
+      self.active.add(rank)
+    return BudgetClaim(self, rank)
+
+  def release(self, rank):
+    with self.changed:
+      self.active.discard(rank)
+      self.changed.notify_all()
+
+  def cancel(self, from_rank=0):
+    with self.changed:
+      self._cancel(from_rank)
+
+  def _cancel(self, from_rank):
+    self.cutoff = from_rank if self.cutoff is None else min(self.cutoff, from_rank)
+    self.changed.notify_all()
+
+  def is_cancelled(self, rank=None):
+    cutoff = self.cutoff
+    return cutoff is not None and (rank is None or rank >= cutoff)
+
+  def remaining(self):
+    return None if self.max_calls is None else max(0, self.max_calls - self.calls)
+
+  def take(self, rank=None):
+    with self.changed:
+      while True:
+        if self.is_cancelled(rank):
+          raise RecognitionCancelled("Recognition was cancelled")
+        if self.max_calls is None:
+          break
+        remaining = self.max_calls - self.calls
+        if remaining <= 0:
+          if rank is not None:
+            self._cancel(rank + 1)
+          raise SpendCapReached(f"Spend cap of {self.max_calls} calls reached")
+        # Better-ranked claims never wait on worse-ranked ones, so this always ends
+        reserved = 0 if rank is None else sum(1 for r in self.active if r < rank)
+        if remaining > reserved:
+          break
+        self.changed.wait()
+      self.calls += 1
+
+  def refund(self):
+    with self.changed:
+      self.calls -= 1
+      self.changed.notify_all()
+
+
+class BudgetClaim():
+  """One ranked recognition's view of a shared RequestBudget, passed as budget= to GeminiInference."""
+  def __init__(self, budget, rank):
+    self.budget = budget
+    self.rank = rank
+
+  def take(self):
+    self.budget.take(self.rank)
+
+  def refund(self):
+    self.budget.refund()
+
+  def is_cancelled(self):
+    return self.budget.is_cancelled(self.rank)
+
+
+MULTI_IMAGE_PROMPT = """The photos above are {count} candidate photos of the same listing, labelled Image 1 to Image {count}.
+At most one of them shows the part label. Find the part number on it as instructed, and also answer
+which image it came from as <IMAGE>n</IMAGE>. If no image shows a part number, answer <START>NONE<END>."""
+
+UPLOAD_MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+def prepare_upload_image(image_bytes, max_long_edge=None, quality=None, crop_box=None):
+  """
+    Shrink an image for upload to Gemini.
+
+    The image is cropped (optionally), scaled so its long edge is at most max_long_edge
+    and re-encoded as JPEG. A JPEG that needs neither is passed through untouched, and the
+    original is kept whenever re-encoding would not make it smaller.
+
+    Args:
+      image_bytes: Encoded image.
+      max_long_edge: Longest side in pixels (default cfg.gemini_image_max_long_edge).
+      quality: JPEG quality (default cfg.gemini_image_quality).
+      crop_box: Optional (left, top, right, bottom) region as fractions of width and height.
+
+    Returns:
+      (bytes, mime_type) to send.
+  """
+  max_long_edge = max_long_edge or cfg.gemini_image_max_long_edge
+  quality = quality or cfg.gemini_image_quality
+
+  img = Image.open(io.BytesIO(image_bytes))
+  original_format = img.format
+  if crop_box is None and original_format == 'JPEG' and max(img.size) <= max_long_edge:
+    return image_bytes, 'image/jpeg'
+
+  img = ImageOps.exif_transpose(img).convert('RGB')
+  if crop_box is not None:
+    left, top, right, bottom = crop_box
+    width, height = img.size
+    img = img.crop((int(left * width), int(top * height), int(right * width), int(bottom * height)))
+  if max(img.size) > max_long_edge:
+    img.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+
+  buffer = io.BytesIO()
+  img.save(buffer, format='JPEG', quality=quality, optimize=True)
+  prepared = buffer.getvalue()
+  if crop_box is None and original_format in UPLOAD_MIME_TYPES and len(prepared) >= len(image_bytes):
+    return image_bytes, UPLOAD_MIME_TYPES[original_format]
+  return prepared, 'image/jpeg'
+
 DEFAULT_PROMPT = """Identify the VAG (Volkswagen Audi Group) part number from the photo using this comprehensive algorithm:
 1. **Scan the Image Thoroughly:**
    - Examine all text and numbers in the image, focusing on labels, stickers, or embossed areas.
@@ -67,9 +240,19 @@ If there are multiple numbers in the image, please identify the one that is most
 """
 
 class GeminiInference():
-  def __init__(self, api_keys, model_name='gemini-1.5-flash', car_brand=None):
+  def __init__(self, api_keys, model_name='gemini-1.5-flash', car_brand=None, use_cache=None, top_k=None,
+               speculative_candidates=None, speculative_max_calls=None):
     self.api_keys = api_keys
-    self.current_key_index = 0
+    if len(api_keys) > 1 and not per_model_clients_supported():
+      logging.warning(f"Per-key Gemini clients are untested with google-generativeai {getattr(genai, '__version__', '?')}. "
+                      f"Using only the first of {len(api_keys)} API keys")
+      self.api_keys = api_keys[:1]
+    # Picker candidates sent together in one request by recognize_top_k (None: one image per request)
+    self.top_k = cfg.gemini_top_k if top_k is None else top_k
+    # Candidates recognised concurrently by recognition.recognize_speculative, and their API call cap
+    self.speculative_candidates = cfg.speculative_candidates if speculative_candidates is None else speculative_candidates
+    self.speculative_max_calls = cfg.speculative_max_calls if speculative_max_calls is None else speculative_max_calls
+    self.model_name = model_name
     self.car_brand = car_brand.lower() if car_brand else None
     self.prompts = self.load_prompts()
 
@@ -100,17 +283,28 @@ class GeminiInference():
     ]
 
     self.system_prompt = self.prompts.get(self.car_brand, {}).get('main_prompt', DEFAULT_PROMPT)
+    self.validation_prompt = self.prompts.get(self.car_brand, {}).get('validation_prompt', "")
+    self.prompt_hash = hashlib.sha256(f"{self.system_prompt}\n{self.validation_prompt}".encode()).hexdigest()
+
+    if use_cache is None:
+      use_cache = cfg.recognition_cache_enabled
+    self.recognition_cache = RecognitionCache() if use_cache else None
     
-    self.model = genai.GenerativeModel(
+    # One main and one validator model per API key, dispatched by per-key token buckets
+    self.models = [self.bind_api_key(genai.GenerativeModel(
         model_name=model_name,
         generation_config=generation_config,
         safety_settings=safety_settings,
         system_instruction=self.system_prompt
-    )
+    ), api_key) for api_key in self.api_keys]
 
-    self.validator_model = self.create_validator_model(model_name)
-    self.incorrect_predictions = []
-    self.message_history = []
+    self.validator_models = [self.bind_api_key(self.create_validator_model(model_name), api_key)
+                             for api_key in self.api_keys]
+    self.dispatcher = KeyDispatcher(self.api_keys)
+
+    # Bytes before and after prepare_upload_image, for the end of run report
+    self.upload_stats = {'images': 0, 'original_bytes': 0, 'uploaded_bytes': 0, 'prepare_seconds': 0.0}
+    self.upload_stats_lock = threading.Lock()
 
   def load_prompts(self):
     try:
@@ -121,16 +315,54 @@ class GeminiInference():
       return {}
 
   def configure_api(self):
-    genai.configure(api_key=self.api_keys[self.current_key_index])
+    genai.configure(api_key=self.api_keys[0])
 
-  def switch_api_key(self):
-    self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-    self.configure_api()
-    logging.info(f"Switched to API key index: {self.current_key_index}")
+  def bind_api_key(self, model, api_key):
+    # With a single key the process-wide client from configure_api() is enough
+    if len(self.api_keys) == 1:
+      return model
+    return bind_model_client(model, api_key)
+
+  def call_with_key(self, request, max_retries=10, budget=None):
+    # request(key_index) makes one API call with the models of that key
+    limiter = get_rate_limiter()
+    for attempt in range(max_retries):
+        if budget is not None:
+            budget.take()
+        with get_metrics().timer('gemini.key_wait'):
+            key_index = self.dispatcher.acquire()
+        if budget is not None and budget.is_cancelled():
+            # Another candidate won while this one waited for a key
+            self.dispatcher.release(key_index)
+            budget.refund()
+            raise RecognitionCancelled("Recognition was cancelled")
+        limiter.wait(GEMINI_API_HOST)
+        get_metrics().inc('gemini_api_calls')
+        try:
+            with get_metrics().timer('gemini.api_call'):
+                response = request(key_index)
+        except Exception as e:
+            if "quota" in str(e).lower() or "429" in str(e):
+                get_metrics().inc('gemini_quota_retries')
+                # Quotas are per key: only this key is benched, the shared host rate is left alone
+                self.dispatcher.release(key_index, quota_error=True)
+                if budget is not None:
+                    # Requests without a response do not count towards the spend cap
+                    budget.refund()
+                logging.warning(f"Rate limit reached on API key index {key_index}. Attempt {attempt + 1}/{max_retries}.")
+                continue
+            self.dispatcher.release(key_index)
+            if budget is not None:
+                budget.refund()
+            raise
+        self.dispatcher.release(key_index)
+        limiter.feedback(GEMINI_API_HOST, 200)
+        return response
+
+    logging.error("Max retries reached. Unable to get a response.")
+    raise Exception("Max retries reached. Unable to get a response.")
 
   def create_validator_model(self, model_name):
-    genai.configure(api_key=self.api_keys[self.current_key_index])
-    
     generation_config = {
         "temperature": 1,
         "top_p": 1,
@@ -159,53 +391,58 @@ class GeminiInference():
                                  generation_config=generation_config,
                                  safety_settings=safety_settings)
 
-  def get_response(self, img_data, retry=False):
-    max_retries = 10
-    base_delay = 5
+  def image_part(self, img_data, crop_box=None):
+    # Prepared and encoded once per image, then shared by every main and validator request about it
+    image_bytes = img_data.getvalue() if isinstance(img_data, io.BytesIO) else img_data.read_bytes()
+    mime_type = 'image/jpeg'
+    if cfg.gemini_image_prepare or crop_box is not None:
+      start = time.perf_counter()
+      try:
+        prepared, mime_type = prepare_upload_image(image_bytes, crop_box=crop_box)
+      except Exception as e:
+        logging.warning(f"Could not prepare image for upload ({e}). Sending it unchanged.")
+        prepared = image_bytes
+      with self.upload_stats_lock:
+        self.upload_stats['images'] += 1
+        self.upload_stats['original_bytes'] += len(image_bytes)
+        self.upload_stats['uploaded_bytes'] += len(prepared)
+        self.upload_stats['prepare_seconds'] += time.perf_counter() - start
+      image_bytes = prepared
+    get_metrics().inc('gemini_image_bytes', len(image_bytes))
+    return {
+        "inline_data": {
+            "mime_type": mime_type,
+            "data": image_bytes
+        }
+    }
+
+  def upload_summary(self):
+    with self.upload_stats_lock:
+      stats = dict(self.upload_stats)
+    saved = stats['original_bytes'] - stats['uploaded_bytes']
+    stats['saved_fraction'] = saved / stats['original_bytes'] if stats['original_bytes'] else 0.0
+    return stats
+
+  def get_response(self, image_part, retry=False, incorrect_predictions=(), budget=None):
+    # Single-shot request: no chat history is kept or replayed, the image is sent once per call
+    prompt_parts = [] if not retry else [
+        "It is not correct. Try again. Look for the numbers that are highly VAG number"
+    ]
+    if retry and incorrect_predictions:
+        prompt_parts.append(f"These numbers were already rejected: {', '.join(incorrect_predictions)}")
     
-    for attempt in range(max_retries):
-        try:
-            image_parts = [
-                {
-                    "inline_data": {
-                        "mime_type": "image/jpeg",
-                        "data": img_data.getvalue() if isinstance(img_data, io.BytesIO) else img_data.read_bytes()
-                    }
-                },
-            ]
-            
-            prompt_parts = [] if not retry else [
-                "It is not correct. Try again. Look for the numbers that are highly VAG number"
-            ]
-            
-            full_prompt = image_parts + prompt_parts
-            
-            sleep(random.uniform(1, 3))
-            
-            chat = self.model.start_chat(history=self.message_history)
-            response = chat.send_message(full_prompt)
-            
-            logging.info(f"Main model response: {response.text}")
-            
-            self.message_history.append({"role": "user", "parts": full_prompt})
-            self.message_history.append({"role": "model", "parts": [response.text]})
-            
-            return response.text
-            
-        except Exception as e:
-            if "quota" in str(e).lower():
-                delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
-                if delay > 300:
-                    self.switch_api_key()
-                    delay = base_delay
-                logging.warning(f"Rate limit reached. Attempt {attempt + 1}/{max_retries}. Retrying in {delay:.2f} seconds...")
-                time.sleep(delay)
-            else:
-                logging.error(f"Error in get_response: {str(e)}")
-                raise
+    full_prompt = [image_part] + prompt_parts
     
-    logging.error("Max retries reached. Unable to get a response.")
-    raise Exception("Max retries reached. Unable to get a response.")
+    try:
+        response = self.call_with_key(lambda key_index: self.models[key_index].generate_content(full_prompt), budget=budget)
+    except RecognitionCancelled:
+        raise
+    except Exception as e:
+        logging.error(f"Error in get_response: {str(e)}")
+        raise
+    
+    logging.info(f"Main model response: {response.text}")
+    return response.text
 
   def format_part_number(self, number):
     if self.car_brand == 'audi' and re.match(r'^[A-Z0-9]{3}[0-9]{3}[0-9]{3,5}[A-Z]?$', number.replace(' ', '').replace('-', '')):
@@ -226,68 +463,76 @@ class GeminiInference():
       return self.format_part_number(number)
     return number
 
-  def validate_number(self, extracted_number, img_data):
-    genai.configure(api_key=self.api_keys[self.current_key_index])
-    
+  def validate_number(self, extracted_number, image_part, incorrect_predictions=(), budget=None):
     formatted_number = self.format_part_number(extracted_number)
     
-    image_parts = [
-        {
-            "inline_data": {
-                "mime_type": "image/jpeg",
-                "data": img_data.getvalue() if isinstance(img_data, io.BytesIO) else img_data.read_bytes()
-            }
-        },
-    ]
-    
-    validation_prompt = self.prompts.get(self.car_brand, {}).get('validation_prompt', "")
-    incorrect_predictions_str = ", ".join(self.incorrect_predictions)
-    prompt = validation_prompt.format(extracted_number=extracted_number, incorrect_predictions=incorrect_predictions_str)
+    incorrect_predictions_str = ", ".join(incorrect_predictions)
+    prompt = self.validation_prompt.format(extracted_number=extracted_number, incorrect_predictions=incorrect_predictions_str)
 
     prompt_parts = [
-        image_parts[0],
+        image_part,
         prompt,
     ]
     
-    response = self.validator_model.generate_content(prompt_parts)
+    response = self.call_with_key(lambda key_index: self.validator_models[key_index].generate_content(prompt_parts),
+                                  budget=budget)
     
     logging.info(f"Validator model response: {response.text}")
     return response.text
 
-  def reset_incorrect_predictions(self):
-    self.incorrect_predictions = []
-    self.message_history = []
-
-  def __call__(self, image_path):
-    self.configure_api()
-    
+  def read_image(self, image_path):
     if image_path.startswith('http'):
-        response = requests.get(image_path, stream=True)
-        img_data = io.BytesIO(response.content)
-    else:
-        img = Path(image_path)
-        if not img.exists():
-            raise FileNotFoundError(f"Could not find image: {img}")
-        img_data = img
+        return get_image_cache().fetch(image_path)
+    img = Path(image_path)
+    if not img.exists():
+        raise FileNotFoundError(f"Could not find image: {img}")
+    return img.read_bytes()
+
+  def cache_key(self, image_bytes, crop_box=None):
+    # Answers depend on what was uploaded, so the preparation settings are part of the key
+    upload_settings = (f"{cfg.gemini_image_max_long_edge}/{cfg.gemini_image_quality}"
+                       if cfg.gemini_image_prepare else "original")
+    return RecognitionCache.make_key(hashlib.sha256(image_bytes).hexdigest(), self.car_brand,
+                                     self.prompt_hash, f"{self.model_name}|{upload_settings}|{crop_box}")
+
+  def __call__(self, image_path, crop_box=None, budget=None):
+    image_bytes = self.read_image(image_path)
 
-    self.message_history = []
+    if self.recognition_cache is None:
+        return self.recognize(io.BytesIO(image_bytes), crop_box=crop_box, budget=budget)
+
+    cache_key = self.cache_key(image_bytes, crop_box)
+    cached_number = self.recognition_cache.get(cache_key)
+    if cached_number is not None:
+        logging.info(f"Recognition cache hit for {image_path}: {cached_number}")
+        return cached_number
+
+    number = self.recognize(io.BytesIO(image_bytes), crop_box=crop_box, budget=budget)
+    self.recognition_cache.put(cache_key, number)
+    return number
+
+  @timed('gemini.recognize')
+  def recognize(self, img_data, crop_box=None, budget=None):
+    # All per-image state is local, so one instance is safe to share across worker threads
+    image_part = self.image_part(img_data, crop_box=crop_box)
+    incorrect_predictions = []
 
     max_attempts = 2
     for attempt in range(max_attempts):
-        answer = self.get_response(img_data, retry=(attempt > 0))
+        answer = self.get_response(image_part, retry=(attempt > 0), incorrect_predictions=incorrect_predictions,
+                                   budget=budget)
         extracted_number = self.extract_number(answer)
         
         logging.info(f"Attempt {attempt + 1}: Extracted number: {extracted_number}")
         
         if extracted_number.upper() != "NONE":
-            validation_result = self.validate_number(extracted_number, img_data)
+            validation_result = self.validate_number(extracted_number, image_part, incorrect_predictions, budget=budget)
             if "<VALID>" in validation_result:
                 logging.info(f"Valid number found: {extracted_number}")
-                self.reset_incorrect_predictions()
                 return extracted_number
             else:
                 logging.warning(f"Validation failed: {validation_result}")
-                self.incorrect_predictions.append(extracted_number)
+                incorrect_predictions.append(extracted_number)
                 if attempt < max_attempts - 1:
                     logging.info(f"Attempting to find another number (Attempt {attempt + 2}/{max_attempts})")
         else:
@@ -296,5 +541,74 @@ class GeminiInference():
                 logging.info(f"Attempting to find another number (Attempt {attempt + 2}/{max_attempts})")
 
     logging.warning("All attempts failed. Returning NONE.")
-    self.reset_incorrect_predictions()
     return "NONE"
+
+  @timed('gemini.recognize_top_k')
+  def recognize_top_k(self, image_paths):
+    """
+      Recognise several picker candidates with one request instead of one per image.
+
+      The images are sent together, labelled Image 1..n, and the model answers with the
+      part number and the image it read it from. That answer is validated against its
+      image, and a rejected number is retried once with the rejected numbers listed, as in
+      recognize. Cached answers for any candidate are used without calling the API, and
+      candidates that fail to load are left out of the request.
+
+      Args:
+        image_paths: Candidate image links or paths, best picker score first.
+
+      Returns:
+        (number, image_path): number is "NONE" (with the top candidate) if no image had one.
+    """
+    images = []
+    for path in image_paths:
+      try:
+        images.append((path, self.read_image(path)))
+      except Exception as e:
+        logging.warning(f"Leaving {path} out of the multi-image request: {e}")
+    if not images:
+      return "NONE", image_paths[0] if image_paths else None
+    keys = [self.cache_key(image_bytes) for _, image_bytes in images]
+    if self.recognition_cache is not None:
+      for (path, _), key in zip(images, keys):
+        cached_number = self.recognition_cache.get(key)
+        if cached_number is not None and cached_number.upper() != "NONE":
+          logging.info(f"Recognition cache hit for {path}: {cached_number}")
+          return cached_number, path
+
+    image_parts = [self.image_part(io.BytesIO(image_bytes)) for _, image_bytes in images]
+    labelled_parts = []
+    for i, image_part in enumerate(image_parts):
+      labelled_parts += [f"Image {i + 1}:", image_part]
+    labelled_parts.append(MULTI_IMAGE_PROMPT.format(count=len(image_parts)))
+
+    incorrect_predictions = []
+    max_attempts = 2
+    for attempt in range(max_attempts):
+      prompt_parts = list(labelled_parts)
+      if incorrect_predictions:
+        prompt_parts.append(f"These numbers were already rejected: {', '.join(incorrect_predictions)}")
+      answer = self.call_with_key(lambda key_index: self.models[key_index].generate_content(prompt_parts)).text
+      logging.info(f"Multi-image response: {answer}")
+
+      extracted_number = self.extract_number(answer)
+      if extracted_number.upper() == "NONE":
+        logging.warning(f"No number found in any of {len(images)} images (attempt {attempt + 1})")
+        break
+
+      match = re.search(r'<IMAGE>\s*(\d+)\s*</IMAGE>', answer)
+      index = int(match.group(1)) - 1 if match else 0
+      if not 0 <= index < len(images):
+        index = 0
+      path = images[index][0]
+
+      validation_result = self.validate_number(extracted_number, image_parts[index], incorrect_predictions)
+      if "<VALID>" in validation_result:
+        logging.info(f"Valid number found in image {index + 1}: {extracted_number}")
+        if self.recognition_cache is not None:
+          self.recognition_cache.put(keys[index], extracted_number)
+        return extracted_number, path
+      logging.warning(f"Validation failed: {validation_result}")
+      incorrect_predictions.append(extracted_number)
+
+    return "NONE", images[0][0] if images else None
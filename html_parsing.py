@@ -0,0 +1,274 @@
+import importlib.util
+import logging
+from html.parser import HTMLParser
+
+from config import Config as cfg
+from lazy_import import lazy_module
+
+bs4 = lazy_module('bs4')
+
+
+def clean_image_link(src):
+    if src.startswith('//'):
+        return 'https:' + src
+    elif not src.startswith('http'):
+        return 'https://auctions.yahoo.co.jp' + src
+    return src
+
+
+def unique(links):
+    return list(dict.fromkeys(links))
+
+
+class BeautifulSoupBackend():
+    """
+    Full-tree parsing with BeautifulSoup.
+
+    features='html.parser' is the pure-Python parser the scraper always used; 'lxml' builds
+    the same tree with the C parser.
+    """
+    def __init__(self, features='html.parser'):
+        self.features = features
+        self.name = features
+
+    def search_items(self, html):
+        """Return (image_src, product_link) pairs for the products on a search results page."""
+        soup = bs4.BeautifulSoup(html, self.features)
+
+        # Try different selectors to find product items
+        product_items = (
+            soup.select('li.Product') or
+            soup.select('div.ProductTile') or
+            soup.select('div[class*="product"]')
+        )
+        items = []
+        for item in product_items:
+            link = item.select_one('a[href^="https://"]')
+            img = item.select_one('img[src^="https://"]')
+            items.append((img.get('src') if img else None, link.get('href') if link else None))
+        return items
+
+    def listing(self, html):
+        """Return the image links, price, title and seller of a listing page."""
+        soup = bs4.BeautifulSoup(html, self.features)
+
+        image_links = []
+        # Find images in the "ProductImage__images" class
+        for element in soup.find_all(class_="ProductImage__images"):
+            for img in element.find_all('img'):
+                src = img.get('src') or img.get('data-src')
+                if src:
+                    image_links.append(clean_image_link(src))
+
+        price_elem = soup.find('dd', class_='Price__value')
+        title_elem = soup.find(class_='ProductTitle__text') or soup.find('h1')
+        seller_elem = soup.select_one('.Seller__name a') or soup.find(class_='Seller__name')
+        return {
+            'image_links': unique(image_links),
+            'price': price_elem.text.strip() if price_elem else 'N/A',
+            'title': title_elem.get_text(strip=True) if title_elem else 'N/A',
+            'seller': seller_elem.get_text(strip=True) if seller_elem else 'N/A',
+        }
+
+
+class SelectolaxBackend():
+    """CSS selection over selectolax's C (lexbor) parser. Needs the optional selectolax package."""
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self.parser_cls = LexborHTMLParser
+
+    def search_items(self, html):
+        tree = self.parser_cls(html)
+        product_items = (
+            tree.css('li.Product') or
+            tree.css('div.ProductTile') or
+            tree.css('div[class*="product"]')
+        )
+        items = []
+        for item in product_items:
+            link = item.css_first('a[href^="https://"]')
+            img = item.css_first('img[src^="https://"]')
+            items.append((img.attributes.get('src') if img else None, link.attributes.get('href') if link else None))
+        return items
+
+    def listing(self, html):
+        tree = self.parser_cls(html)
+
+        image_links = []
+        for img in tree.css('.ProductImage__images img'):
+            src = img.attributes.get('src') or img.attributes.get('data-src')
+            if src:
+                image_links.append(clean_image_link(src))
+
+        price_elem = tree.css_first('dd.Price__value')
+        title_elem = tree.css_first('.ProductTitle__text') or tree.css_first('h1')
+        seller_elem = tree.css_first('.Seller__name a') or tree.css_first('.Seller__name')
+        return {
+            'image_links': unique(image_links),
+            'price': price_elem.text().strip() if price_elem else 'N/A',
+            'title': title_elem.text(strip=True) if title_elem else 'N/A',
+            'seller': seller_elem.text(strip=True) if seller_elem else 'N/A',
+        }
+
+
+class _TargetedExtractor(HTMLParser):
+    """
+    Streaming extractor that keeps no tree.
+
+    It only tracks whether it is inside one of the few elements the scraper reads
+    ("ProductImage__images", dd.Price__value, ".ProductTitle__text" or the first h1,
+    ".Seller__name" and its first link, and li.Product / div.ProductTile items on search
+    pages). Nesting is followed by counting start and end tags with the same name as the
+    open target element. Like the tree builders, a new li.Product closes an unclosed one.
+    Text is collected only from the first element matching each target, as find() does.
+    """
+    VOID_TAGS = ('img', 'br', 'hr', 'input', 'meta', 'link', 'source', 'wbr', 'area', 'base', 'col', 'embed', 'track')
+    TEXT_TARGETS = {'price': ('dd', 'Price__value'), 'title': (None, 'ProductTitle__text'), 'h1': ('h1', None),
+                    'seller': (None, 'Seller__name'), 'seller_link': ('a', None)}
+    ITEM_TARGETS = (('li', 'Product'), ('div', 'ProductTile'))
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.open = {}  # target name -> [tag, depth]
+        self.image_links = []
+        self.texts = {name: None for name in self.TEXT_TARGETS}  # None until the target is found
+        self.items = []
+
+    def _enter(self, name, tag):
+        self.open[name] = [tag, 0]
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+
+        # Void tags never get an end tag, so keep them out of the depth counting
+        if tag not in self.VOID_TAGS:
+            for state in self.open.values():
+                if state[0] == tag:
+                    state[1] += 1
+
+        if 'ProductImage__images' in classes and 'images' not in self.open:
+            self._enter('images', tag)
+        # '.Seller__name a' is the first link inside any .Seller__name element
+        if 'Seller__name' in classes and 'seller_scope' not in self.open:
+            self._enter('seller_scope', tag)
+        for name, (target_tag, target_class) in self.TEXT_TARGETS.items():
+            if name == 'seller_link' and 'seller_scope' not in self.open:
+                continue
+            if (self.texts[name] is None and target_tag in (None, tag)
+                    and (target_class is None or target_class in classes)):
+                self._enter(name, tag)
+                self.texts[name] = []
+        for target_tag, target_class in self.ITEM_TARGETS:
+            if tag == target_tag and target_class in classes:
+                if self.open.get('item', [None])[0] == 'li' == tag:
+                    # An li start tag closes the open li, as in the HTML tree builders
+                    del self.open['item']
+                if 'item' not in self.open:
+                    self._enter('item', tag)
+                    self.items.append([None, None])
+
+        if tag == 'img' and 'images' in self.open:
+            src = attrs.get('src') or attrs.get('data-src')
+            if src:
+                self.image_links.append(clean_image_link(src))
+        if 'item' in self.open:
+            item = self.items[-1]
+            if tag == 'img' and item[0] is None and (attrs.get('src') or '').startswith('https://'):
+                item[0] = attrs['src']
+            if tag == 'a' and item[1] is None and (attrs.get('href') or '').startswith('https://'):
+                item[1] = attrs['href']
+
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS:
+            return
+        for name, state in list(self.open.items()):
+            if state[0] == tag:
+                if state[1] == 0:
+                    del self.open[name]
+                else:
+                    state[1] -= 1
+
+    def handle_data(self, data):
+        for name in self.TEXT_TARGETS:
+            if name in self.open:
+                self.texts[name].append(data)
+
+    def text(self, name, strip_fragments=True):
+        """
+        Text of the first element matching target name, or None if there was none.
+
+        strip_fragments=True strips and joins every text fragment like get_text(strip=True);
+        otherwise the joined text is stripped once like .text.strip().
+        """
+        parts = self.texts[name]
+        if parts is None:
+            return None
+        if strip_fragments:
+            return ''.join(part.strip() for part in parts)
+        return ''.join(parts).strip()
+
+
+class StreamingBackend():
+    """Targeted streaming extractor on the standard library tokenizer, with no tree building."""
+    name = 'stream'
+
+    def _extract(self, html):
+        if isinstance(html, bytes):
+            html = html.decode('utf-8', errors='replace')
+        extractor = _TargetedExtractor()
+        extractor.feed(html)
+        extractor.close()
+        return extractor
+
+    def search_items(self, html):
+        items = [tuple(item) for item in self._extract(html).items]
+        if not items:
+            # The generic 'div[class*="product"]' fallback needs real CSS selection
+            return BeautifulSoupBackend('html.parser').search_items(html)
+        return items
+
+    def listing(self, html):
+        extractor = self._extract(html)
+        price = extractor.text('price', strip_fragments=False)
+        # Like the other backends, fall back to the first h1 for the title and to the whole
+        # .Seller__name text when it holds no link
+        title = extractor.text('title')
+        if title is None:
+            title = extractor.text('h1')
+        seller = extractor.text('seller_link')
+        if seller is None:
+            seller = extractor.text('seller')
+        return {
+            'image_links': unique(extractor.image_links),
+            'price': 'N/A' if price is None else price,
+            'title': 'N/A' if title is None else title,
+            'seller': 'N/A' if seller is None else seller,
+        }
+
+
+def get_html_backend(name=None):
+    """
+    Return the HTML extraction backend called name (default cfg.html_parser).
+
+    Supported names: 'html.parser', 'lxml', 'selectolax' and 'stream'. A backend whose
+    optional package is missing falls back to 'html.parser'.
+    """
+    name = name or cfg.html_parser
+    try:
+        if name == 'selectolax':
+            return SelectolaxBackend()
+        if name == 'stream':
+            return StreamingBackend()
+        if name == 'lxml':
+            if importlib.util.find_spec('lxml') is None:
+                raise ImportError("No module named 'lxml'")
+            return BeautifulSoupBackend('lxml')
+        if name == 'html.parser':
+            return BeautifulSoupBackend('html.parser')
+    except ImportError as e:
+        logging.warning(f"HTML parser backend '{name}' is unavailable ({e}). Falling back to 'html.parser'.")
+        return BeautifulSoupBackend('html.parser')
+    raise ValueError(f"Unknown HTML parser backend '{name}'")
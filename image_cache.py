@@ -0,0 +1,213 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from config import Config as cfg
+from rate_limiter import get_rate_limiter
+from metrics import get_metrics
+
+
+class ImageCache():
+    """
+    Content-addressed on-disk cache for downloaded images.
+
+    Blobs are stored under their sha256 digest, so a picture reachable from several URLs is
+    kept once. index.json maps every URL to the digest, size and last access time of its
+    content, and the least recently used URLs are evicted once the blobs outgrow max_bytes.
+    The index is rewritten at most every flush_interval seconds and at exit, so a crash
+    loses only the newest entries (their blobs are downloaded again).
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, flush_interval=None):
+        self.cache_dir = cache_dir or cfg.image_cache_dir
+        self.max_bytes = max_bytes or cfg.image_cache_max_bytes
+        self.flush_interval = cfg.image_cache_flush_interval if flush_interval is None else flush_interval
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.index = self._load_index()
+        self.blob_sizes = {}
+        self.blob_refs = {}
+        for entry in self.index.values():
+            self.blob_sizes[entry['sha256']] = entry['size']
+            self.blob_refs[entry['sha256']] = self.blob_refs.get(entry['sha256'], 0) + 1
+        self.total_bytes = sum(self.blob_sizes.values())
+        self._dirty = False
+        self._written_at = time.monotonic()
+        atexit.register(self.flush)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError as e:
+            logging.warning(f"Image cache index {self.index_path} is corrupted ({e}). Starting with an empty index.")
+            return {}
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._written_at = time.monotonic()
+
+    def _mark_dirty(self):
+        # Called with the lock held. Changes reach index.json at most every flush_interval
+        self._dirty = True
+        if time.monotonic() - self._written_at >= self.flush_interval:
+            self._write_index()
+
+    def _remove_url(self, url):
+        entry = self.index.pop(url, None)
+        if entry is None:
+            return
+        digest = entry['sha256']
+        self.blob_refs[digest] -= 1
+        if self.blob_refs[digest] > 0:
+            return
+        del self.blob_refs[digest]
+        self.total_bytes -= self.blob_sizes.pop(digest, 0)
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for url, _ in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            self._remove_url(url)
+            if self.total_bytes <= self.max_bytes:
+                break
+
+    def digest(self, url):
+        """Return the content hash cached for url, or None if it is not cached."""
+        entry = self.index.get(url)
+        return entry['sha256'] if entry else None
+
+    def path(self, url):
+        """Return the blob file holding url's content, or None if it is not cached."""
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        blob_path = self._blob_path(entry['sha256'])
+        return blob_path if os.path.exists(blob_path) else None
+
+    def get(self, url):
+        """Return the cached bytes for url, or None on a miss."""
+        with self.lock:
+            entry = self.index.get(url)
+        if entry is not None:
+            try:
+                with open(self._blob_path(entry['sha256']), 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                content = None
+            with self.lock:
+                if content is None:
+                    self._remove_url(url)
+                    self._mark_dirty()
+                else:
+                    entry['last_access'] = time.time()
+                    self._dirty = True
+                    self.hits += 1
+                    get_metrics().inc('image_cache_hits')
+                    return content
+        with self.lock:
+            self.misses += 1
+        get_metrics().inc('image_cache_misses')
+        return None
+
+    def put(self, url, content):
+        """Store content for url and return its content hash."""
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, blob_path)
+
+        with self.lock:
+            previous = self.index.get(url)
+            if previous is not None and previous['sha256'] == digest:
+                previous['last_access'] = time.time()
+            else:
+                self._remove_url(url)
+                self.index[url] = {'sha256': digest, 'size': len(content), 'last_access': time.time()}
+                self.blob_refs[digest] = self.blob_refs.get(digest, 0) + 1
+                if digest not in self.blob_sizes:
+                    self.blob_sizes[digest] = len(content)
+                    self.total_bytes += len(content)
+                self._evict()
+            self._mark_dirty()
+        return digest
+
+    def discard(self, url):
+        """Drop url from the cache, e.g. after its content failed to decode."""
+        with self.lock:
+            if url not in self.index:
+                return
+            self._remove_url(url)
+            self._mark_dirty()
+
+    def fetch(self, url, session=None, headers=None, timeout=None):
+        """
+        Return the bytes behind url, downloading and caching them on a miss.
+
+        Raises:
+            requests.RequestException: If the download fails.
+        """
+        content = self.get(url)
+        if content is not None:
+            return content
+
+        response = get_rate_limiter().get(session or requests, url, headers=headers, timeout=timeout or cfg.request_timeout)
+        response.raise_for_status()
+        content = response.content
+        get_metrics().inc('image_bytes_downloaded', len(content))
+        self.put(url, content)
+        return content
+
+    def flush(self):
+        with self.lock:
+            if self._dirty:
+                self._write_index()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.index),
+            'bytes': self.total_bytes,
+        }
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+def get_image_cache():
+    """Return the image cache shared by the picker and the Gemini recognizer."""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
@@ -0,0 +1,113 @@
+import logging
+import threading
+
+import numpy as np
+
+from config import Config as cfg
+
+
+class KerasBackend():
+    """Runs the picker through the Keras model itself."""
+    name = 'keras'
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, dataset):
+        return self.model.predict(dataset)
+
+    def predict_on_batch(self, images):
+        return self.model.predict_on_batch(images)
+
+
+class TFLiteBackend():
+    """
+    Runs an exported TFLite picker (export_model.py) on the CPU.
+
+    The interpreter comes from the small tflite_runtime package when it is installed and
+    from TensorFlow otherwise. Integer inputs and outputs of fully quantised models are
+    (de)quantised here, so callers always pass and get float32. The interpreter is not
+    thread-safe, so calls are serialised.
+    """
+    name = 'tflite'
+
+    def __init__(self, model_path=None, num_threads=None):
+        self.model_path = model_path or cfg.tflite_model_path
+        self.num_threads = num_threads or cfg.tflite_num_threads
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = self.input_details['shape'][0]
+        self.lock = threading.Lock()
+        logging.info(f"Loaded TFLite picker {self.model_path} with {self.num_threads} threads "
+                     f"(input {np.dtype(self.input_details['dtype']).name})")
+
+    def _quantize(self, images):
+        dtype = self.input_details['dtype']
+        if dtype == np.float32:
+            return images
+        scale, zero_point = self.input_details['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, outputs):
+        if self.output_details['dtype'] == np.float32:
+            return outputs
+        scale, zero_point = self.output_details['quantization']
+        return (outputs.astype(np.float32) - zero_point) * scale
+
+    def predict_on_batch(self, images):
+        """
+        Score one batch of preprocessed images.
+
+        Args:
+            images (array-like): float32 batch of shape (n, *image_size, 3).
+
+        Returns:
+            np.ndarray: float32 scores of shape (n, 1).
+        """
+        images = self._quantize(np.asarray(images, dtype=np.float32))
+        with self.lock:
+            if images.shape[0] != self.batch_size:
+                # Resizing reallocates the tensors, so it only happens when the batch size changes
+                self.interpreter.resize_tensor_input(self.input_details['index'], images.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = images.shape[0]
+            self.interpreter.set_tensor(self.input_details['index'], images)
+            self.interpreter.invoke()
+            outputs = self.interpreter.get_tensor(self.output_details['index'])
+        return self._dequantize(outputs)
+
+    def predict(self, dataset):
+        """Score every batch of a dataset from Processor.batch_images, like Keras' predict."""
+        outputs = [self.predict_on_batch(batch.numpy()) for batch in dataset]
+        if not outputs:
+            return np.zeros((0, 1), dtype=np.float32)
+        return np.concatenate(outputs)
+
+
+BACKENDS = ('keras', 'tflite')
+
+
+def get_inference_backend(name, model=None, model_path=None, num_threads=None):
+    """
+    Build the picker inference backend called name.
+
+    Args:
+        name (str): 'keras' or 'tflite'.
+        model (tf.keras.Model, optional): The Keras picker, required for 'keras'.
+        model_path (str, optional): TFLite file (default cfg.tflite_model_path).
+        num_threads (int, optional): TFLite interpreter threads (default cfg.tflite_num_threads).
+    """
+    if name == 'keras':
+        return KerasBackend(model)
+    if name == 'tflite':
+        return TFLiteBackend(model_path=model_path, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend '{name}'. Expected one of {BACKENDS}")
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import pickle
+import threading
+
+RESULT_KEYS = ("predicted_number", "url", "price", "correct_image_link", "incorrect_image_links", "status")
+
+# Listing statuses besides 'OK' and 'NO_IMAGES' that are not final. Such listings are
+# processed again on resume and never enter the crawl index
+RETRY_STATUSES = ('ERROR', 'BUDGET_EXHAUSTED')
+
+
+def result_status(record):
+    """Status of a listing result. Records written before the status column only carry failures in predicted_number."""
+    if record.get('status'):
+        return record['status']
+    return record['predicted_number'] if record['predicted_number'] in ('NO_IMAGES', *RETRY_STATUSES) else 'OK'
+
+
+def is_final(record):
+    """True if record is a definitive result rather than a failure to retry later."""
+    return result_status(record) not in RETRY_STATUSES
+
+
+
+class RunJournal():
+    """
+    Append-only JSONL journal of processed listings.
+
+    Each listing's result is written as one line, flushed and fsynced as soon as it is
+    known, so a crash loses at most the listing in flight. A resumed run skips the URLs
+    already in the journal, except those whose latest result is not final (ERROR or
+    BUDGET_EXHAUSTED), and export() writes the whole run to Excel in one pass, with the
+    latest result of every URL.
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        if not resume and os.path.exists(path):
+            logging.warning(f"Starting a new journal. The previous one is kept as {path}.prev")
+            os.replace(path, f"{path}.prev")
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def extend(self, records):
+        """Append several records with a single fsync."""
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash can leave the last line half-written
+                    logging.warning(f"Skipping unreadable line {line_number} in {self.path}")
+        return records
+
+    def latest_records(self):
+        # A listing that failed and was retried by a resumed run is journaled more than once
+        latest = {}
+        for record in self.records():
+            latest[record['url']] = record
+        return list(latest.values())
+
+    def processed_urls(self):
+        # Failed and budget-starved listings are processed again on resume
+        return {record['url'] for record in self.latest_records() if is_final(record)}
+
+    def to_result(self):
+        records = [{**record, 'status': result_status(record)} for record in self.latest_records()]
+        return {k: [record.get(k) for record in records] for k in RESULT_KEYS}
+
+    def export(self, filename):
+        """Write every journaled listing to {filename}.xlsx, or {filename}.pkl if Excel fails."""
+        result = self.to_result()
+        try:
+            import pandas as pd
+            pd.DataFrame(result).to_excel(f"{filename}.xlsx", index=False)
+            logging.info(f"Final results saved to {filename}.xlsx")
+        except Exception as e:
+            logging.error(f"Error saving to Excel: {e}. Saving in pickle format instead.")
+            with open(f'{filename}.pkl', 'wb') as f:
+                pickle.dump(result, f)
+            logging.info(f"Final results saved to {filename}.pkl")
+        return result
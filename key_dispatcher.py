@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from config import Config as cfg
+
+
+class TokenBucket():
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity` tokens."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class KeyDispatcher():
+    """
+    Spreads Gemini requests over every API key.
+
+    Each key has its own token bucket for its requests-per-minute quota. acquire() blocks
+    until some healthy key has a token and hands out the key that is ready first, preferring
+    the one with the fewest requests in flight. A key that returns a quota error cools
+    down for a period that doubles on each consecutive quota error, while the other keys
+    keep serving requests.
+    """
+    def __init__(self, api_keys, requests_per_minute=None, burst=None, cooldown=None, max_cooldown=None):
+        requests_per_minute = requests_per_minute or cfg.gemini_requests_per_minute
+        burst = burst or cfg.gemini_burst
+        self.cooldown = cooldown or cfg.gemini_key_cooldown
+        self.max_cooldown = max_cooldown or cfg.gemini_key_max_cooldown
+        self.condition = threading.Condition()
+        self.waiting = 0
+        self.started = time.monotonic()
+        self.keys = [{
+            'bucket': TokenBucket(requests_per_minute / 60, burst),
+            'cooldown_until': 0.0,
+            'consecutive_quota_errors': 0,
+            'in_flight': 0,
+            'completed': 0,
+            'quota_errors': 0,
+        } for _ in api_keys]
+
+    def _ready_in(self, state, now):
+        if state['cooldown_until'] > now:
+            return state['cooldown_until'] - now
+        return state['bucket'].wait_time(now)
+
+    def acquire(self):
+        """Block until a key can take a request and return its index."""
+        with self.condition:
+            self.waiting += 1
+            while True:
+                now = time.monotonic()
+                index = min(range(len(self.keys)),
+                            key=lambda i: (self._ready_in(self.keys[i], now), self.keys[i]['in_flight']))
+                wait = self._ready_in(self.keys[index], now)
+                if wait <= 0:
+                    break
+                self.condition.wait(timeout=wait)
+
+            state = self.keys[index]
+            state['bucket'].take(now)
+            state['in_flight'] += 1
+            self.waiting -= 1
+            return index
+
+    def release(self, index, quota_error=False):
+        """Return a key taken with acquire(), reporting whether it hit its quota."""
+        with self.condition:
+            state = self.keys[index]
+            state['in_flight'] -= 1
+            if quota_error:
+                state['quota_errors'] += 1
+                cooldown = min(self.cooldown * 2 ** state['consecutive_quota_errors'], self.max_cooldown)
+                state['consecutive_quota_errors'] += 1
+                state['cooldown_until'] = time.monotonic() + cooldown
+                logging.warning(f"API key index {index} hit its quota. Cooling down for {cooldown:.0f} seconds")
+            else:
+                state['completed'] += 1
+                state['consecutive_quota_errors'] = 0
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            minutes = max(now - self.started, 1e-9) / 60
+            return {
+                'waiting': self.waiting,
+                'keys': [{
+                    'key_index': i,
+                    'in_flight': state['in_flight'],
+                    'completed': state['completed'],
+                    'quota_errors': state['quota_errors'],
+                    'cooling_down': state['cooldown_until'] > now,
+                    'requests_per_minute': state['completed'] / minutes,
+                } for i, state in enumerate(self.keys)],
+            }
@@ -0,0 +1,34 @@
+import importlib
+import sys
+
+
+class LazyModule():
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Heavy dependencies (TensorFlow, PIL, google.generativeai) are bound through this at
+    module level, so `--help`, scrape-only runs and Gemini-only re-runs do not pay their
+    import time unless a stage actually uses them.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    """Return name itself if it is already imported, otherwise a LazyModule for it."""
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
@@ -2,24 +2,20 @@ from config import *
 from picker_model import TargetModel
 from gemini_model import GeminiInference
 from collect_data import collect_links, encode_images
+from image_cache import get_image_cache
+from recognition import BUDGET_EXHAUSTED, recognize_images
+from pipeline import reduce_pipelined
+from rate_limiter import backoff_delay, get_rate_limiter
+from journal import RESULT_KEYS, RunJournal, is_final
+from crawl_index import CrawlIndex
+from metrics import get_metrics
 
 import argparse
 
-import telebot
-import numpy as np
-import pandas as pd  
-import pickle 
-import requests
 import json
-
-from io import BytesIO
-from PIL import Image
-from IPython.display import clear_output
+import time
 
 import logging
-import time
-import random
-from requests.exceptions import RequestException
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -39,6 +35,23 @@ def parse_args():
     parser.add_argument('--ignore-error', action='store_true', help="Ignore errors and continue processing")
     parser.add_argument('--max-steps', type=int, default=3, required=False, help="Maximum steps to collect links")
     parser.add_argument('--max-links', type=int, default=90, required=False, help="Maximum number of links to collect")
+    parser.add_argument('--pipelined', action='store_true', help="Run scrape, image fetch, picker, Gemini and price stages as an overlapping pipeline (failed stages are retried on their own rather than whole listings)")
+    parser.add_argument('--stage-concurrency', nargs='+', default=[], metavar='STAGE=N', help="Workers per pipeline stage, e.g. scrape=4 fetch=4 picker=1 gemini=1 price=4")
+    parser.add_argument('--batch-picker', action='store_true', help="With --pipelined, batch picker inference across listings")
+    parser.add_argument('--no-recognition-cache', action='store_true', help="Always call Gemini, bypassing the recognition result cache")
+    parser.add_argument('--resume', action='store_true', help="Resume from the run journal, skipping links that were already processed")
+    parser.add_argument('--max-age-days', type=float, default=None, help="Reprocess listings recognised more than this many days ago (default from config)")
+    parser.add_argument('--reprocess-all', action='store_true', help="Ignore the crawl index and process every collected listing")
+    parser.add_argument('--picker-backend', choices=['keras', 'tflite'], default=None, help="Picker inference backend (default from config). 'tflite' runs the model written by export_model.py")
+    parser.add_argument('--picker-threads', type=int, default=None, help="CPU threads for the TFLite picker (default from config)")
+    parser.add_argument('--cascade', action='store_true', help="Screen images with a low-resolution picker pass and re-score only the top/ambiguous ones at full resolution")
+    parser.add_argument('--early-exit-threshold', type=float, default=None, help="Send the first image scoring at least this to Gemini while the rest of the listing is still being scored")
+    parser.add_argument('--gemini-top-k', type=int, default=None, help="Send the top K picker candidates to Gemini in one request before falling back to one image at a time")
+    parser.add_argument('--speculative', type=int, default=None, metavar='N', help="Recognise the top N picker candidates concurrently and keep the best-ranked number")
+    parser.add_argument('--speculative-max-calls', type=int, default=None, help="Gemini call cap per listing in speculative mode (default from config)")
+    parser.add_argument('--no-metrics', action='store_true', help="Disable run metrics (counters and latency histograms)")
+    parser.add_argument('--metrics-json', type=str, default=None, help="Where to write the JSON metrics summary (default: <save-file-name>.metrics.json)")
+    parser.add_argument('--metrics-prom', type=str, default=None, help="Also write the metrics in Prometheus text format to this file")
     parser.add_argument('--car-brand', type=str, required=True, help="Car brand to use for prompts. Supported brands: audi, toyota, nissan, suzuki, honda, daihatsu, subaru, mazda, bmw, lexus, volkswagen, volvo, mini, fiat, citroen, renault, ford, isuzu, opel, mitsubishi, mercedes, jaguar, peugeot, porsche, alfa_romeo, chevrolet")
 
     args = parser.parse_args()
@@ -56,6 +69,13 @@ def parse_args():
         else:
             raise ValueError(f"Car brand '{args.car_brand}' not found in prompts.json")
     
+    stage_concurrency = {}
+    for item in args.stage_concurrency:
+        stage, _, workers = item.partition('=')
+        if stage not in cfg.pipeline_concurrency or not workers.isdigit() or int(workers) < 1:
+            parser.error(f"Invalid --stage-concurrency value '{item}'. Expected STAGE=N with STAGE in {list(cfg.pipeline_concurrency)}")
+        stage_concurrency[stage] = int(workers)
+
     if args.prompt is None:
         prompt = None
     else:
@@ -78,10 +98,47 @@ def parse_args():
             'ignore_error': args.ignore_error,
             'max_steps': args.max_steps,
             'max_links': args.max_links,
-            'car_brand': args.car_brand
+            'car_brand': args.car_brand,
+            'pipelined': args.pipelined,
+            'stage_concurrency': stage_concurrency,
+            'batch_picker': args.batch_picker,
+            'use_recognition_cache': not args.no_recognition_cache,
+            'resume': args.resume,
+            'max_age_days': args.max_age_days,
+            'reprocess_all': args.reprocess_all,
+            'picker_backend': args.picker_backend,
+            'picker_threads': args.picker_threads,
+            'cascade': args.cascade or None,
+            'early_exit_threshold': args.early_exit_threshold,
+            'gemini_top_k': args.gemini_top_k,
+            'speculative': args.speculative,
+            'speculative_max_calls': args.speculative_max_calls,
+            'metrics_enabled': cfg.metrics_enabled and not args.no_metrics,
+            'metrics_json': args.metrics_json or f"{args.save_file_name}.metrics.json",
+            'metrics_prom': args.metrics_prom
         },)
 
-import math
+def picker_candidates(picker:TargetModel, page_img_links:list):
+    # Picker output for recognize_images. stream_candidates scores lazily, so a math domain
+    # error can surface while the candidates are consumed; the images not yielded yet then
+    # get default probabilities
+    yielded = set()
+    try:
+        if picker.early_exit_threshold is not None:
+            # Scored lazily: Gemini sees the first confident image while the rest still load
+            images_probs = picker.stream_candidates(page_img_links)
+        else:
+            images_probs = picker.do_inference_return_probs(page_img_links)
+        for item in images_probs:
+            yielded.add(item['image_link'])
+            yield item
+    except ValueError as ve:
+        if "math domain error" not in str(ve).lower():
+            raise
+        logging.warning("Math domain error occurred during inference. Using default probabilities.")
+        for image_link in page_img_links:
+            if image_link not in yielded:
+                yield {'image_link': image_link, 'score': 1.0 / len(page_img_links)}
 
 def encode(link:str, 
            picker:TargetModel, 
@@ -89,12 +146,12 @@ def encode(link:str,
            **kwargs) -> dict:
     logging.info(f"Processing link: {link}")
     max_retries = 3
-    base_delay = 5
 
     for attempt in range(max_retries):
         try:
-            page_img_links = picker.processor.parse_images_from_page(link)
-            page_img_links = list(set(page_img_links))
+            # One fetch gives both the images and the price
+            listing = picker.processor.parse_listing(link)
+            page_img_links = list(set(listing['image_links']))
             
             logging.info(f"Found {len(page_img_links)} unique image links")
             
@@ -105,53 +162,26 @@ def encode(link:str,
                     "url": link, 
                     "price": "N/A", 
                     "correct_image_link": "N/A", 
-                    "incorrect_image_links": "N/A"
+                    "incorrect_image_links": "N/A",
+                    "status": "NO_IMAGES"
                 }
             
-            try:
-                images_probs = picker.do_inference_return_probs(page_img_links)
-            except ValueError as ve:
-                if "math domain error" in str(ve).lower():
-                    logging.warning(f"Math domain error occurred during inference. Using default probabilities.")
-                    images_probs = [{'image_link': link, 'score': 1.0 / len(page_img_links)} for link in page_img_links]
-                else:
-                    raise
-            
-            detail_number = 'none'
-            target_image_link = None
-            
-            for target_image_link, score in [(i['image_link'], i['score']) for i in images_probs]:
-                try:
-                    logging.info(f'Predicting on image {target_image_link} with score {score}')
-                    detail_number = str(model(target_image_link))
-                    
-                    if detail_number.lower().strip() != 'none':
-                        break
-                except Exception as e:
-                    if "429 Resource has been exhausted" in str(e):
-                        delay = base_delay + random.uniform(0, 2)
-                        logging.warning(f"429 error encountered. Retrying in {delay:.2f} seconds...")
-                        time.sleep(delay)
-                        continue
-                    logging.warning(f"Error processing image {target_image_link}: {e}")
-                    continue
-            
-            if detail_number.lower().strip() == 'none':
-                logging.warning("No detail number found in any image")
-            
-            logging.info(f"Predicted number id: {detail_number}")
+            images_probs = picker_candidates(picker, page_img_links)
+            detail_number, target_image_link = recognize_images(images_probs, model)
+            # A spent spend cap is not an answer, so it stays out of the number column
+            status = BUDGET_EXHAUSTED if detail_number == BUDGET_EXHAUSTED else "OK"
 
-            parsed_info = picker.processor.load_product_info(link)
             return {
-                "predicted_number": detail_number, 
+                "predicted_number": "N/A" if status == BUDGET_EXHAUSTED else detail_number, 
                 "url": link, 
-                "price": parsed_info.get('price', 'N/A'), 
+                "price": listing['price'], 
                 "correct_image_link": target_image_link, 
-                "incorrect_image_links": ", ".join([l for l in page_img_links if l != target_image_link])
+                "incorrect_image_links": ", ".join([l for l in page_img_links if l != target_image_link]),
+                "status": status
             }
         except Exception as e:
             if attempt < max_retries - 1:
-                delay = base_delay + random.uniform(0, 2)
+                delay = backoff_delay(attempt)
                 logging.warning(f"Error occurred: {e}. Retrying in {delay:.2f} seconds... (Attempt {attempt + 1}/{max_retries})")
                 time.sleep(delay)
             else:
@@ -161,53 +191,57 @@ def encode(link:str,
                     "url": link, 
                     "price": "N/A", 
                     "correct_image_link": "N/A", 
-                    "incorrect_image_links": "N/A"
+                    "incorrect_image_links": "N/A",
+                    "status": "ERROR"
                 }
 
-def save_intermediate_results(result, filename):
-    try:
-        pd.DataFrame(result).to_excel(f"{filename}.xlsx", index=False)
-        logging.info(f"Intermediate results saved to {filename}.xlsx")
-    except Exception as e:
-        logging.error(f"Error saving intermediate results to Excel: {e}. Saving in pickle format instead.")
-        with open(f'{filename}.pkl', 'wb') as f:
-            pickle.dump(result, f)
-
 def reduce(main_link:str, 
            picker:TargetModel, 
            model:GeminiInference,  # Add model as a parameter
            ignore_error:bool = False, 
            max_steps:int = 3, 
            max_links:int = 90, 
-           savename:str = 'recognized_data', 
+           journal:RunJournal = None,
+           crawl_index:CrawlIndex = None,
            **kwargs):
     logging.info(f"Starting link collection from {main_link}")
-    all_links = collect_links(picker, main_link, max_pages=max_steps, max_links=max_links)
+    all_links = collect_links(picker, main_link, max_pages=max_steps, max_links=max_links, crawl_index=crawl_index)
     all_links = list(set(all_links))
     logging.info(f"Collected {len(all_links)} unique links")
+
+    if crawl_index is not None:
+        new_links = crawl_index.filter_new(all_links)
+        known_links = set(all_links) - set(new_links)
+        stored = crawl_index.stored_results(known_links)
+        if journal is not None and stored:
+            # Listings recognised by earlier runs are exported with their stored results
+            journal.extend(list(stored.values()))
+        all_links = new_links
+        logging.info(f"{len(all_links)} links are new or stale, {len(stored)} reuse their stored results")
+
+    if journal is not None:
+        processed_urls = journal.processed_urls()
+        all_links = [l for l in all_links if l not in processed_urls]
+        logging.info(f"{len(processed_urls)} links already journaled, {len(all_links)} left to process")
                
-    result = {"predicted_number": list(), 
-              "url": list(), 
-              "price": list(), 
-              "correct_image_link": list(), 
-              "incorrect_image_links": list()}
+    result = {k: list() for k in RESULT_KEYS}
     
     max_retries = 20
-    base_delay = 5  # Initial delay in seconds
     
     for i, page_link in enumerate(all_links):     
         for attempt in range(max_retries):
             try: 
-                # Add a small random delay before each request
-                time.sleep(random.uniform(1, 3))
-                
                 logging.info(f"Processing {i+1}/{len(all_links)} link: {page_link}")
-                encoded_data = encode(page_link, picker, model)  # Remove kwargs here
+                with get_metrics().timer('listing'):
+                    encoded_data = encode(page_link, picker, model)  # Remove kwargs here
+                get_metrics().inc('listings_processed')
                 for (k, v) in encoded_data.items(): 
                     result[k].append(v)
 
-                if (i + 1) % 10 == 0:  # Save every 10 iterations
-                    save_intermediate_results(result, f"{savename}_part_{i // 10 + 1}")
+                if crawl_index is not None and is_final(encoded_data):
+                    crawl_index.record(page_link, encoded_data)
+                if journal is not None:
+                    journal.append(encoded_data)
                 
                 logging.info("Processing successful")
                 break  # If successful, break out of the retry loop
@@ -226,36 +260,74 @@ if __name__ == "__main__":
     # Parse important variables
     model_name, api_keys, additional_data = parse_args() 
 
+    get_metrics().enabled = additional_data['metrics_enabled']
+
     # Initialize models
     assert model_name in ['gemini'], "There is no available model you're looking for"
 
     if model_name == 'gemini': 
         model = GeminiInference(api_keys=api_keys, 
                                 model_name=additional_data['gemini_model'], 
-                                car_brand=additional_data['car_brand'])
+                                car_brand=additional_data['car_brand'],
+                                use_cache=additional_data['use_recognition_cache'],
+                                top_k=additional_data['gemini_top_k'],
+                                speculative_candidates=additional_data['speculative'],
+                                speculative_max_calls=additional_data['speculative_max_calls'])
     else: 
         model = None 
 
-    picker = TargetModel()
+    picker = TargetModel(backend=additional_data['picker_backend'], num_threads=additional_data['picker_threads'],
+                         cascade=additional_data['cascade'],
+                         early_exit_threshold=additional_data['early_exit_threshold'])
+    journal = RunJournal(f"{additional_data['savename']}.journal.jsonl", resume=additional_data['resume'])
+    if additional_data['reprocess_all']:
+        crawl_index = None
+    else:
+        max_age_days = additional_data['max_age_days']
+        crawl_index = CrawlIndex(max_age=None if max_age_days is None else max_age_days * 24 * 3600)
 
     logging.info(f"Starting encoding process with model: {model_name}")
-    encoding_result = reduce(
-        additional_data['main_link'], 
-        picker=picker, 
-        model=model,
-        ignore_error=additional_data['ignore_error'],
-        max_steps=additional_data['max_steps'],
-        max_links=additional_data['max_links'],
-        savename=additional_data['savename']
-    )
+    if additional_data['pipelined']:
+        # GeminiInference dispatches over all keys, so run one Gemini worker per key by default
+        additional_data['stage_concurrency'].setdefault('gemini', len(api_keys))
+        encoding_result = reduce_pipelined(
+            additional_data['main_link'],
+            picker=picker,
+            model=model,
+            ignore_error=additional_data['ignore_error'],
+            max_steps=additional_data['max_steps'],
+            max_links=additional_data['max_links'],
+            concurrency=additional_data['stage_concurrency'],
+            journal=journal,
+            crawl_index=crawl_index,
+            batch_picker=additional_data['batch_picker']
+        )
+    else:
+        encoding_result = reduce(
+            additional_data['main_link'], 
+            picker=picker, 
+            model=model,
+            ignore_error=additional_data['ignore_error'],
+            max_steps=additional_data['max_steps'],
+            max_links=additional_data['max_links'],
+            journal=journal,
+            crawl_index=crawl_index
+        )
+    logging.info(f"Image cache stats: {get_image_cache().stats()}")
+    if picker.cascade:
+        logging.info(f"Picker cascade stats: {picker.cascade_stats}")
+    if model is not None and model.recognition_cache is not None:
+        logging.info(f"Recognition cache stats: {model.recognition_cache.stats()}")
+    if model is not None:
+        logging.info(f"Gemini API key stats: {model.dispatcher.stats()}")
+        logging.info(f"Gemini upload stats: {model.upload_summary()}")
+    logging.info(f"Host request rates: {get_rate_limiter().stats()}")
 
-    # Save final results
-    try:
-        pd.DataFrame(encoding_result).to_excel(f"{additional_data['savename']}.xlsx", index=False)
-        logging.info(f"Final results saved to {additional_data['savename']}.xlsx")
-    except Exception as e:
-        logging.error(f"Error saving to Excel: {e}. Saving in pickle format instead.")
-        with open(f'{additional_data["savename"]}.pkl', 'wb') as f:
-            pickle.dump(encoding_result, f)
-        logging.info(f"Final results saved to {additional_data['savename']}.pkl")
+    # Save final results, including listings journaled by earlier resumed runs
+    journal.export(additional_data['savename'])
+
+    if additional_data['metrics_enabled']:
+        get_metrics().write_json(additional_data['metrics_json'])
+        if additional_data['metrics_prom']:
+            get_metrics().write_prometheus(additional_data['metrics_prom'])
 
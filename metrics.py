@@ -0,0 +1,208 @@
+import functools
+import inspect
+import json
+import logging
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+PROMETHEUS_PREFIX = 'extra_'
+
+
+class Histogram():
+    """Fixed-bucket latency histogram with count, sum, min and max."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class Metrics():
+    """
+    Process-wide counters and latency histograms.
+
+    Counters count things (pages, images, bytes, API calls, retries, cache hits) and
+    histograms hold latencies in seconds measured with time.perf_counter. While disabled,
+    inc(), observe() and the timers return straight away.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the time spent in the with block under name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def summary(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'counters': dict(sorted(self.counters.items())),
+                'latency_seconds': {name: h.summary() for name, h in sorted(self.histograms.items())},
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        logging.info(f"Wrote metrics summary to {path}")
+
+    def prometheus_text(self):
+        """Counters and histograms in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{PROMETHEUS_PREFIX}{metric_name(name)}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{PROMETHEUS_PREFIX}{metric_name(name)}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines += [f"{metric}_sum {histogram.sum}", f"{metric}_count {histogram.count}"]
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.prometheus_text())
+        logging.info(f"Wrote Prometheus metrics to {path}")
+
+
+def metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name).lower()
+
+
+_metrics = Metrics()
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    return _metrics
+
+
+def timed(name):
+    """
+    Decorator recording each call's latency in the histogram called name.
+
+    For generator functions the time spent producing items is summed over the whole
+    iteration (not just the call that creates the generator) and the number of items is
+    counted as name + '.items'.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not _metrics.enabled:
+                    return (yield from func(*args, **kwargs))
+                generator = func(*args, **kwargs)
+                elapsed, items = 0.0, 0
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += time.perf_counter() - start
+                        items += 1
+                        yield item
+                finally:
+                    generator.close()
+                    _metrics.observe(name, elapsed)
+                    _metrics.inc(f"{name}.items", items)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class RuntimeMeta(type):
+    """Metaclass timing every method of a class into the metrics histogram 'Class.method'."""
+    def __new__(cls, name, bases, dct):
+        for attr, value in dct.items():
+            if inspect.isfunction(value):
+                dct[attr] = timed(f"{name}.{attr}")(value)
+        return super(RuntimeMeta, cls).__new__(cls, name, bases, dct)
@@ -1,13 +1,21 @@
 from dataprocessor import * 
 from config import * 
-
-import tensorflow as tf
-from tensorflow.keras.applications import MobileNetV3Small
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, BatchNormalization
-from tensorflow.keras.models import Model
+from dataprocessor import image_digest
+from image_cache import get_image_cache
+from embedding_store import EmbeddingStore
+from inference_backend import get_inference_backend
+from lazy_import import lazy_module
+from metrics import RuntimeMeta
+
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
 import numpy as np
 
-def build_model(num_classes) -> Model:
+# Imported on first use, so importing this module stays cheap
+tf = lazy_module('tensorflow')
+
+def build_model(num_classes, input_shape=(512, 512, 3)) -> "tf.keras.Model":
     """
     Builds a small image classifier using MobileNetV3Small backbone.
 
@@ -18,12 +26,18 @@ def build_model(num_classes) -> Model:
 
     Args:
       num_classes: Number of classes for classification.
+      input_shape: Image shape. The network is fully convolutional up to the pooling layer,
+        so weights are interchangeable between input shapes.
 
     Returns:
       A Keras model.
     """
     # Load pre-trained MobileNetV3Small model (without top layers)
-    base_model = MobileNetV3Small(weights='imagenet', include_top=False, input_shape=(512, 512, 3))
+    from tensorflow.keras.applications import MobileNetV3Small
+    from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, BatchNormalization
+    from tensorflow.keras.models import Model
+
+    base_model = MobileNetV3Small(weights='imagenet', include_top=False, input_shape=input_shape)
 
     # Add custom layers on top of the base model
     x = base_model.output
@@ -49,34 +63,333 @@ def build_model(num_classes) -> Model:
 
     return model
 
+def split_model(model):
+  """
+    Splits the picker into its frozen backbone and its trainable head.
+
+    The head is rebuilt from the model's own layers after the pooling layer, so both
+    parts share weights with the full model.
+
+    Args:
+      model: A model returned by build_model.
+
+    Returns:
+      (backbone, head): backbone maps images to pooled embeddings, head maps embeddings to scores.
+  """
+  from tensorflow.keras.layers import GlobalAveragePooling2D
+  from tensorflow.keras.models import Model
+
+  pool_index = max(i for i, layer in enumerate(model.layers) if isinstance(layer, GlobalAveragePooling2D))
+  pool = model.layers[pool_index]
+  backbone = Model(inputs=model.input, outputs=pool.output)
+
+  embedding = tf.keras.Input(shape=pool.output.shape[1:])
+  x = embedding
+  for layer in model.layers[pool_index + 1:]:
+    x = layer(x)
+  head = Model(inputs=embedding, outputs=x)
+  head.compile(
+      optimizer=tf.keras.optimizers.AdamW(learning_rate=0.001),
+      loss='binary_crossentropy',
+      metrics=['accuracy']
+  )
+  return backbone, head
+
 # model = build_model(1)
 # model.load_weights(cfg.model_path)
 
+def rank_predictions(image_links, predictions):
+  """Pair picker scores with their image links, sorted from most to least likely label photo."""
+  # Add a small epsilon to avoid log(0) or division by zero
+  epsilon = 1e-10
+  predictions = np.clip(np.asarray(predictions), epsilon, 1 - epsilon)
+
+  predictions = predictions.flatten().tolist() 
+  predictions = [{'image_link': l, 'score': p} for l, p in zip(image_links, predictions)]
+  return sorted(predictions, key=lambda i: float(i['score']), reverse=True)
+
 class TargetModel(metaclass=RuntimeMeta):
-  def __init__(self, model_path = None):
+  def __init__(self, model_path = None, use_embedding_cache = None, backend = None, num_threads = None, cascade = None,
+               early_exit_threshold = None, require_weights = True):
     # self.gemini = GeminiInference()
     if model_path == None: 
       model_path = cfg.model_path
-
-
-    self.model = build_model(1)
-    self.model.load_weights(model_path)
+    if use_embedding_cache == None:
+      use_embedding_cache = cfg.embedding_cache_enabled
+    if backend == None:
+      backend = cfg.inference_backend
+    if cascade == None:
+      cascade = cfg.cascade_enabled
+    if early_exit_threshold == None:
+      early_exit_threshold = cfg.early_exit_threshold
+    if backend != 'keras' and use_embedding_cache:
+      logging.info(f"The {backend} picker scores whole images, so the embedding cache is disabled")
+      use_embedding_cache = False
+
+    # The Keras model is built on first use, so scrape-only work never loads TensorFlow
+    self.model_path = model_path
+    # Training may start from the ImageNet backbone and an untrained head when there is no checkpoint yet
+    self.require_weights = require_weights
+    self._model = None
+    self._model_lock = threading.Lock()
+    self.backend = backend
+    self.num_threads = num_threads
+    self._predictor = None
+
+    # Resolution cascade: a low-resolution copy of the picker screens images first
+    self.cascade = cascade
+    self._low_res_model = None
+    self.cascade_stats = {'listings': 0, 'low_res_scored': 0, 'full_res_scored': 0, 'embedding_hits': 0}
+    self._stats_lock = threading.Lock()
 
     self.processor = Processor(cfg.image_size, cfg.batch_size)
+    self.embedding_store = EmbeddingStore(weights_path=model_path) if use_embedding_cache else None
+
+    # Score at which stream_candidates releases an image before the rest are scored
+    self.early_exit_threshold = early_exit_threshold
 
     self.predicted_image_saving_path = "example_prediction.jpg"
 
+  def load_model(self):
+    with self._model_lock:
+      if self._model is None:
+        # Checked before building, which downloads the ImageNet backbone weights on first use
+        has_checkpoint = os.path.exists(self.model_path)
+        if not has_checkpoint and self.require_weights:
+          raise FileNotFoundError(f"No picker checkpoint at {self.model_path}. Train one with train.py or set cfg.model_path")
+        model = build_model(1)
+        if has_checkpoint:
+          model.load_weights(self.model_path)
+        else:
+          logging.warning(f"No picker checkpoint at {self.model_path}. Starting from an untrained head")
+        self._backbone, self._head = split_model(model)
+        self._model = model
+    return self._model
+
+  @property
+  def model(self):
+    return self._model if self._model is not None else self.load_model()
+
+  @property
+  def predictor(self):
+    # Runs full images through the configured backend; built on first use like the model
+    if self._predictor is None:
+      with self._model_lock:
+        if self._predictor is None and self.backend != 'keras':
+          self._predictor = get_inference_backend(self.backend, num_threads=self.num_threads)
+      if self._predictor is None:
+        self._predictor = get_inference_backend('keras', model=self.model)
+    return self._predictor
+
+  @property
+  def low_res_model(self):
+    # Same weights as the full model, built for cfg.cascade_image_size inputs
+    if self._low_res_model is None:
+      model = self.model
+      with self._model_lock:
+        if self._low_res_model is None:
+          low_res_model = build_model(1, input_shape=(*cfg.cascade_image_size, cfg.image_channels))
+          low_res_model.set_weights(model.get_weights())
+          self._low_res_model = low_res_model
+    return self._low_res_model
+
+  @property
+  def backbone(self):
+    self.model
+    return self._backbone
+
+  @property
+  def head(self):
+    self.model
+    return self._head
+
   def do_inference_return_probs(self, image_links): 
-    dataset = self.processor(image_links)
-    predictions = self.model.predict(dataset)
+    if self.embedding_store is not None and not self.cascade:
+      return self.score_embeddings(self.embed_links(image_links))
+
+    loaded = self.processor.load_images(image_links)
+    return self.score_images([l for l, _ in loaded], [img for _, img in loaded])
+
+  def score_images(self, image_links, images):
+    # image_links and images must be aligned: links that failed to load are already dropped
+    if not images:
+      return []
 
-    # Add a small epsilon to avoid log(0) or division by zero
-    epsilon = 1e-10
-    predictions = np.clip(predictions, epsilon, 1 - epsilon)
+    if self.cascade:
+      return self.cascade_score(image_links, images)
 
-    predictions = predictions.flatten().tolist() 
-    predictions = [{'image_link': l, 'score': p} for l, p in zip(image_links, predictions)]
-    return sorted(predictions, key=lambda i: float(i['score']), reverse=True)
+    if self.embedding_store is not None:
+      embedded = self.stored_embeddings(image_links)
+      missing = [(l, img) for l, img in zip(image_links, images) if l not in embedded]
+      embedded.update(self.embed_images([l for l, _ in missing], [img for _, img in missing]))
+      return self.score_embeddings(embedded)
+
+    dataset = self.processor.batch_images(images)
+    predictions = self.predictor.predict(dataset)
+    return rank_predictions(image_links, predictions)
+
+  def cascade_score(self, image_links, images, top_k=None, threshold=None):
+    """
+      Two-stage picker scoring.
+
+      Every image is scored at cfg.cascade_image_size first. Only the top_k images and
+      those scoring at least threshold (the ones that are not obviously negative) are
+      re-scored at full resolution; images with a stored embedding skip straight to their
+      full-resolution score. Re-scored images are ranked ahead of the screened-out ones.
+
+      Args:
+        image_links: Links aligned with images.
+        images: Images from Processor.load_images.
+        top_k: Images always re-scored (default cfg.cascade_top_k).
+        threshold: Low-resolution score from which an image is re-scored (default cfg.cascade_threshold).
+
+      Returns:
+        Scores in the same format as rank_predictions.
+    """
+    top_k = cfg.cascade_top_k if top_k is None else top_k
+    threshold = cfg.cascade_threshold if threshold is None else threshold
+
+    embedded = self.stored_embeddings(image_links) if self.embedding_store is not None else {}
+    pending = [i for i, l in enumerate(image_links) if l not in embedded]
+
+    low_res_scores = {}
+    if pending:
+      batch = self.processor.stack_images([images[i] for i in pending], image_size=cfg.cascade_image_size)
+      predictions = np.concatenate([np.asarray(self.low_res_model.predict_on_batch(batch[j:j + cfg.batch_size])).reshape(-1)
+                                    for j in range(0, len(pending), cfg.batch_size)])
+      low_res_scores = dict(zip(pending, predictions))
+
+    ranked = sorted(pending, key=lambda i: low_res_scores[i], reverse=True)
+    selected = [i for rank, i in enumerate(ranked) if rank < top_k or low_res_scores[i] >= threshold]
+    # Both criteria select a prefix of the ranking, so the rest is the remaining suffix
+    rest = ranked[len(selected):]
+
+    selected_links = [image_links[i] for i in selected]
+    selected_images = [images[i] for i in selected]
+    if self.embedding_store is not None:
+      embedded.update(self.embed_images(selected_links, selected_images))
+      full_res = self.score_embeddings(embedded)
+    elif selected:
+      full_res = rank_predictions(selected_links, self.predictor.predict(self.processor.batch_images(selected_images)))
+    else:
+      full_res = []
+
+    with self._stats_lock:
+      self.cascade_stats['listings'] += 1
+      self.cascade_stats['low_res_scored'] += len(pending)
+      self.cascade_stats['full_res_scored'] += len(selected)
+      self.cascade_stats['embedding_hits'] += len(image_links) - len(pending)
+    logging.info(f"Cascade: {len(pending)} images at low resolution, {len(selected)} re-scored at full resolution, "
+                 f"{len(image_links) - len(pending)} from stored embeddings")
+
+    return full_res + rank_predictions([image_links[i] for i in rest], [low_res_scores[i] for i in rest])
+
+  def stream_scores(self, image_links):
+    """
+      Yield picker scores as images finish, instead of after the whole listing.
+
+      Images with a stored embedding are scored first. The others are downloaded on the
+      processor's download pool and scored in batches of what has arrived. The first
+      image is scored alone and each later batch waits for twice as many images as the
+      previous one (up to the processor's batch size), so the first scores come early
+      while a listing takes O(log n) model calls rather than one per download. Images
+      that fail to load are skipped.
+
+      Yields:
+        dicts with 'image_link' and 'score', in completion order.
+    """
+    pending = list(image_links)
+    if self.embedding_store is not None:
+      embedded = self.stored_embeddings(pending)
+      yield from self.score_embeddings(embedded)
+      pending = [l for l in pending if l not in embedded]
+
+    futures = {self.processor.download_pool.submit(self.processor.load_one, l): l for l in pending}
+    batch_size = 1
+    loaded = []
+    while futures:
+      done, _ = wait(futures, return_when=FIRST_COMPLETED)
+      for future in done:
+        image_link = futures.pop(future)
+        img = future.result()
+        if img is None:
+          logging.warning(f"Failed to load image: {image_link}")
+        else:
+          loaded.append((image_link, img))
+      if not loaded or (futures and len(loaded) < batch_size):
+        continue
+
+      links, images = [l for l, _ in loaded], [img for _, img in loaded]
+      if self.embedding_store is not None:
+        yield from self.score_embeddings(self.embed_images(links, images))
+      else:
+        predictions = self.predictor.predict_on_batch(self.processor.stack_images(images))
+        yield from rank_predictions(links, predictions)
+      loaded = []
+      batch_size = min(2 * batch_size, self.processor.batch_size)
+
+  def stream_candidates(self, image_links, threshold = None):
+    """
+      Recognition candidates with early exit.
+
+      The first image whose score reaches threshold is yielded as soon as it is scored,
+      while the remaining downloads carry on in the background. If the recognizer asks
+      for more, the rest are finished and yielded best first, as in do_inference_return_probs.
+
+      Args:
+        image_links: Listing image links.
+        threshold: Release score (default self.early_exit_threshold).
+
+      Yields:
+        dicts with 'image_link' and 'score'.
+    """
+    threshold = self.early_exit_threshold if threshold is None else threshold
+    scores = []
+    released = None
+    stream = self.stream_scores(image_links)
+    for item in stream:
+      scores.append(item)
+      if item['score'] >= threshold:
+        released = item
+        logging.info(f"Early exit: {item['image_link']} scored {item['score']:.3f} after {len(scores)}/{len(image_links)} images")
+        yield item
+        break
+
+    scores.extend(stream)
+    for item in sorted(scores, key=lambda i: float(i['score']), reverse=True):
+      if item is not released:
+        yield item
+
+  def stored_embeddings(self, image_links):
+    # Only images already in the image cache (or on disk) have a digest to look up
+    digests = {l: image_digest(l) for l in image_links}
+    vectors = self.embedding_store.get_many([d for d in digests.values() if d])
+    return {l: vectors[d] for l, d in digests.items() if d in vectors}
+
+  def embed_images(self, image_links, images):
+    if not images:
+      return {}
+
+    vectors = self.backbone.predict(self.processor.batch_images(images))
+    embedded = dict(zip(image_links, vectors))
+    digests = {l: image_digest(l) for l in image_links}
+    self.embedding_store.put_many({digests[l]: v for l, v in embedded.items() if digests[l]})
+    return embedded
+
+  def embed_links(self, image_links):
+    # Backbone embeddings for image_links; only images without a stored embedding are downloaded
+    embedded = self.stored_embeddings(image_links)
+    loaded = self.processor.load_images([l for l in image_links if l not in embedded])
+    embedded.update(self.embed_images([l for l, _ in loaded], [img for _, img in loaded]))
+    return embedded
+
+  def score_embeddings(self, embedded):
+    if not embedded:
+      return []
+
+    image_links = list(embedded)
+    predictions = self.head.predict_on_batch(np.stack([embedded[l] for l in image_links]))
+    return rank_predictions(image_links, predictions)
 
   def do_inference_minimodel(self, *args, **kwargs):
     results = self.do_inference_return_probs(*args, **kwargs)
@@ -88,8 +401,7 @@ class TargetModel(metaclass=RuntimeMeta):
     # save target_image_link to local image if it link. return local path
 
     if (target_image_link.startswith("http")):
-      response = requests.get(target_image_link)
-      img = Image.open(BytesIO(response.content))
+      img = Image.open(BytesIO(get_image_cache().fetch(target_image_link)))
       img.save(self.predicted_image_saving_path)
       target_image_link = self.predicted_image_saving_path
 
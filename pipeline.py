@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config as cfg
+from batching import BatchedPicker
+from journal import RESULT_KEYS, is_final
+from collect_data import collect_links
+from recognition import BUDGET_EXHAUSTED, recognize_images
+from rate_limiter import backoff_delay
+from metrics import get_metrics
+
+STAGES = ('scrape', 'fetch', 'picker', 'gemini', 'price')
+
+
+def failed_result(url, predicted_number):
+    return {
+        "predicted_number": predicted_number,
+        "url": url,
+        "price": "N/A",
+        "correct_image_link": "N/A",
+        "incorrect_image_links": "N/A",
+        "status": predicted_number
+    }
+
+
+class PipelinedReducer():
+    """
+    Pipelined alternative to main.reduce.
+
+    Every listing flows through scrape -> image fetch -> picker -> gemini -> price stages.
+    The stages are joined by bounded queues and each one runs its own number of workers,
+    so page scraping, image downloads, picker inference and Gemini calls for different
+    listings overlap instead of running one after another. With a BatchedPicker the picker
+    stage scores images from several listings in one model call.
+
+    Errors are handled as in main.reduce: a failing stage is retried up to max_retries
+    times with a backoff before the listing gets an ERROR result, a math domain error in
+    the picker falls back to default probabilities, and an error while recording a result
+    stops the run unless ignore_error is set.
+    """
+    def __init__(self, picker, model, concurrency=None, queue_size=None, journal=None, crawl_index=None, batcher=None,
+                 ignore_error=False, max_retries=3):
+        self.picker = picker
+        self.model = model
+        self.batcher = batcher
+        self.ignore_error = ignore_error
+        self.max_retries = max_retries
+        self.concurrency = {**cfg.pipeline_concurrency, **(concurrency or {})}
+        if batcher is not None and 'picker' not in (concurrency or {}):
+            # Several listings must wait in the picker stage at once to fill a batch
+            self.concurrency['picker'] = cfg.batched_picker_workers
+        self.queue_size = queue_size or cfg.pipeline_queue_size
+        self.journal = journal
+        self.crawl_index = crawl_index
+        self.executor = ThreadPoolExecutor(max_workers=sum(self.concurrency[stage] for stage in STAGES),
+                                           thread_name_prefix='pipeline')
+
+    # Stage functions. They are blocking and run on the executor. Each one takes the
+    # listing state dict and returns it, or sets state['result'] to finish early. A failed
+    # stage is run again on the same state, so stages only remove their inputs on success.
+
+    def scrape(self, state):
+        state['listing'] = self.picker.processor.parse_listing(state['url'])
+        image_links = list(set(state['listing']['image_links']))
+        logging.info(f"Found {len(image_links)} unique image links")
+        if not image_links:
+            logging.warning(f"No images found for link: {state['url']}")
+            state['result'] = failed_result(state['url'], "NO_IMAGES")
+        state['image_links'] = image_links
+        return state
+
+    def fetch(self, state):
+        state['loaded'] = self.picker.processor.load_images(state['image_links'])
+        return state
+
+    def score(self, state):
+        loaded = state['loaded']
+        try:
+            state['images_probs'] = (self.batcher or self.picker).score_images([l for l, _ in loaded], [img for _, img in loaded])
+        except ValueError as ve:
+            if "math domain error" not in str(ve).lower():
+                raise
+            logging.warning("Math domain error occurred during inference. Using default probabilities.")
+            image_links = state['image_links']
+            state['images_probs'] = [{'image_link': link, 'score': 1.0 / len(image_links)} for link in image_links]
+        del state['loaded']
+        return state
+
+    def recognize(self, state):
+        state['detail_number'], state['target_image_link'] = recognize_images(state['images_probs'], self.model)
+        return state
+
+    def price(self, state):
+        # The price was parsed from the same fetch as the images
+        target_image_link = state['target_image_link']
+        # A spent spend cap is not an answer, so it stays out of the number column
+        status = BUDGET_EXHAUSTED if state['detail_number'] == BUDGET_EXHAUSTED else "OK"
+        state['result'] = {
+            "predicted_number": "N/A" if status == BUDGET_EXHAUSTED else state['detail_number'],
+            "url": state['url'],
+            "price": state['listing']['price'],
+            "correct_image_link": target_image_link,
+            "incorrect_image_links": ", ".join([l for l in state['image_links'] if l != target_image_link]),
+            "status": status
+        }
+        return state
+
+    async def _worker(self, name, fn, inbox, outbox, done):
+        loop = asyncio.get_running_loop()
+
+        def timed_stage(state):
+            with get_metrics().timer(f"pipeline.{name}"):
+                return fn(state)
+
+        while True:
+            state = await inbox.get()
+            for attempt in range(self.max_retries):
+                try:
+                    state = await loop.run_in_executor(self.executor, timed_stage, state)
+                    break
+                except Exception as e:
+                    get_metrics().inc(f"pipeline.{name}.errors")
+                    if attempt < self.max_retries - 1:
+                        delay = backoff_delay(attempt)
+                        logging.warning(f"Stage {name} failed for link {state['url']}: {e}. Retrying in {delay:.2f} seconds... (Attempt {attempt + 1}/{self.max_retries})")
+                        await asyncio.sleep(delay)
+                    else:
+                        logging.error(f"Stage {name} failed for link {state['url']} after {self.max_retries} attempts: {e}")
+                        state['result'] = failed_result(state['url'], "ERROR")
+            await (done if 'result' in state else outbox).put(state)
+
+    async def run(self, links):
+        """
+        Process links through the pipeline.
+
+        Args:
+            links (list): Listing page URLs.
+
+        Returns:
+            dict: Column lists in the same layout and link order as main.reduce. If the run
+            stopped on an error, only the listings finished so far are included.
+        """
+        stage_fns = (self.scrape, self.fetch, self.score, self.recognize, self.price)
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in STAGES]
+        done = asyncio.Queue()
+
+        workers = []
+        for i, (name, fn) in enumerate(zip(STAGES, stage_fns)):
+            outbox = queues[i + 1] if i + 1 < len(queues) else done
+            for _ in range(self.concurrency[name]):
+                workers.append(asyncio.create_task(self._worker(name, fn, queues[i], outbox, done)))
+
+        async def feed():
+            for index, url in enumerate(links):
+                await queues[0].put({'index': index, 'url': url})
+        feeder = asyncio.create_task(feed())
+
+        results = [None] * len(links)
+        try:
+            for completed in range(1, len(links) + 1):
+                state = await done.get()
+                results[state['index']] = state['result']
+                get_metrics().inc('listings_processed')
+                logging.info(f"Processed {completed}/{len(links)} link: {state['url']}")
+                try:
+                    if self.crawl_index is not None and is_final(state['result']):
+                        self.crawl_index.record(state['url'], state['result'])
+                    if self.journal is not None:
+                        self.journal.append(state['result'])
+                except Exception as e:
+                    logging.error(f"Unexpected error processing link {state['url']}: {e}")
+                    if not self.ignore_error:
+                        logging.error("Stopping due to error and ignore_error=False")
+                        break
+                    logging.warning("Ignoring error and moving to next link")
+        finally:
+            feeder.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(feeder, *workers, return_exceptions=True)
+        return self.collate(results)
+
+    @staticmethod
+    def collate(results):
+        return {k: [r[k] for r in results if r is not None] for k in RESULT_KEYS}
+
+
+def reduce_pipelined(main_link, picker, model, ignore_error=False, max_steps=3, max_links=90, concurrency=None,
+                     journal=None, crawl_index=None, batch_picker=False, **kwargs):
+    """
+    Collect listing links and recognise them with PipelinedReducer.
+
+    Takes the same arguments as main.reduce and returns the same result dict. Failures are
+    retried per stage rather than per listing; see PipelinedReducer.
+    """
+    logging.info(f"Starting link collection from {main_link}")
+    all_links = collect_links(picker, main_link, max_pages=max_steps, max_links=max_links, crawl_index=crawl_index)
+    all_links = list(set(all_links))
+    logging.info(f"Collected {len(all_links)} unique links")
+
+    if crawl_index is not None:
+        new_links = crawl_index.filter_new(all_links)
+        known_links = set(all_links) - set(new_links)
+        stored = crawl_index.stored_results(known_links)
+        if journal is not None and stored:
+            # Listings recognised by earlier runs are exported with their stored results
+            journal.extend(list(stored.values()))
+        all_links = new_links
+        logging.info(f"{len(all_links)} links are new or stale, {len(stored)} reuse their stored results")
+
+    if journal is not None:
+        processed_urls = journal.processed_urls()
+        all_links = [l for l in all_links if l not in processed_urls]
+        logging.info(f"{len(processed_urls)} links already journaled, {len(all_links)} left to process")
+
+    batcher = BatchedPicker(picker) if batch_picker else None
+    reducer = PipelinedReducer(picker, model, concurrency=concurrency, journal=journal, crawl_index=crawl_index,
+                               batcher=batcher, ignore_error=ignore_error)
+    try:
+        return asyncio.run(reducer.run(all_links))
+    finally:
+        reducer.executor.shutdown(wait=False)
+        if batcher is not None:
+            logging.info(f"Batched picker ran {batcher.batches_run} batches for {batcher.images_scored} images")
+            batcher.close()
@@ -0,0 +1,136 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from config import Config as cfg
+from metrics import get_metrics
+
+
+class RequestCancelled(Exception):
+    """Raised by HostRateLimiter.get when its cancel_event was set while the request waited for a slot."""
+
+
+class HostRateLimiter():
+    """
+    Adaptive per-host request pacing shared by Processor and GeminiInference.
+
+    Every host gets its configured requests-per-second ceiling, and callers reserve evenly
+    spaced slots with wait(). feedback() adapts the rate: a 429, a 5xx or a connection
+    error halves the host's rate (and honours Retry-After), other 4xx responses leave it
+    unchanged, and each success raises it additively back towards the ceiling. Callers
+    retrying a failed request still sleep for backoff_delay() first.
+    """
+    def __init__(self, default_rps=None, host_rps=None, min_rps=None):
+        self.default_rps = default_rps or cfg.rate_limit_default_rps
+        self.host_rps = {**cfg.rate_limit_host_rps, **(host_rps or {})}
+        self.min_rps = min_rps or cfg.rate_limit_min_rps
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).netloc or url
+
+    def _state(self, host):
+        if host not in self.hosts:
+            max_rate = self.host_rps.get(host, self.default_rps)
+            self.hosts[host] = {'rate': max_rate, 'max_rate': max_rate, 'next_at': 0.0, 'blocked_until': 0.0}
+        return self.hosts[host]
+
+    def wait(self, url):
+        """Block until the next request slot for url's host."""
+        with self.lock:
+            state = self._state(self.host_of(url))
+            now = time.monotonic()
+            slot = max(now, state['next_at'], state['blocked_until'])
+            state['next_at'] = slot + 1 / state['rate']
+        if slot > now:
+            time.sleep(slot - now)
+
+    def feedback(self, url, status_code=None, retry_after=None):
+        """
+        Adapt the host's rate to the outcome of a request.
+
+        Args:
+            url (str): The requested URL.
+            status_code (int, optional): HTTP status, or None if the request raised.
+            retry_after (float, optional): Seconds the host asked us to wait.
+        """
+        host = self.host_of(url)
+        with self.lock:
+            state = self._state(host)
+            if status_code is None or status_code == 429 or status_code >= 500:
+                get_metrics().inc('rate_limit_backoffs')
+                state['rate'] = max(self.min_rps, state['rate'] / 2)
+                if retry_after:
+                    state['blocked_until'] = max(state['blocked_until'], time.monotonic() + retry_after)
+                logging.warning(f"Slowing down {host} to {state['rate']:.2f} requests/s (status {status_code})")
+            elif status_code < 400:
+                state['rate'] = min(state['max_rate'], state['rate'] + state['max_rate'] / 10)
+
+    def get(self, session, url, cancel_event=None, **kwargs):
+        """
+        session.get(url) paced by the limiter, feeding the response status back into it.
+
+        Args:
+            cancel_event (threading.Event, optional): Checked after waiting for the slot, so a
+                request that is no longer needed is never sent.
+
+        Raises:
+            requests.RequestException: If the request fails to complete.
+            RequestCancelled: If cancel_event was set before the request went out.
+        """
+        self.wait(url)
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled(f"Request to {url} was cancelled")
+        metrics = get_metrics()
+        metrics.inc('http_requests')
+        start = time.perf_counter()
+        try:
+            response = session.get(url, **kwargs)
+        except Exception:
+            metrics.inc('http_errors')
+            self.feedback(url)
+            raise
+        finally:
+            metrics.observe(f"http.{self.host_of(url)}", time.perf_counter() - start)
+        self.feedback(url, response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {host: round(state['rate'], 3) for host, state in self.hosts.items()}
+
+
+def backoff_delay(attempt):
+    """Seconds to sleep before retry number attempt + 1: exponential with jitter, capped at cfg.retry_backoff_max."""
+    return min(cfg.retry_backoff_max, 2 ** attempt) + random.random()
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header holding either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Return the process-wide per-host rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = HostRateLimiter()
+        return _rate_limiter
@@ -0,0 +1,166 @@
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config as cfg
+from gemini_model import RecognitionCancelled, RequestBudget, SpendCapReached
+from metrics import get_metrics, timed
+
+# detail_number of a listing whose speculative spend cap ran out before any candidate had a number
+BUDGET_EXHAUSTED = 'BUDGET_EXHAUSTED'
+
+
+def is_number(detail_number):
+    return str(detail_number).lower().strip() not in ('none', BUDGET_EXHAUSTED.lower())
+
+
+_speculation_pool = None
+_speculation_pool_lock = threading.Lock()
+
+def get_speculation_pool():
+    """Return the thread pool shared by speculative recognitions."""
+    global _speculation_pool
+    with _speculation_pool_lock:
+        if _speculation_pool is None:
+            _speculation_pool = ThreadPoolExecutor(max_workers=cfg.speculative_workers, thread_name_prefix='speculative')
+        return _speculation_pool
+
+
+def recognize_speculative(candidates, model, budget):
+    """
+    Recognise several candidates concurrently and keep the best-ranked number.
+
+    Results are read in rank order, so a lower-ranked number only wins once every better
+    candidate came back without one. As soon as the winner is known, the other
+    recognitions are cancelled through their shared RequestBudget: queued ones never
+    start and running ones stop before their next API call. The budget also caps the
+    calls all candidates may make together, with better-ranked candidates having first
+    claim on it; nothing is ever sent beyond the cap.
+
+    Args:
+        candidates (list): (image_link, score) pairs, best first.
+        model (GeminiInference): The part number recognizer.
+        budget (RequestBudget): Spend cap in API calls for the whole set.
+
+    Returns:
+        tuple: (detail_number, target_image_link). detail_number is 'none' if no candidate had
+        a number, or BUDGET_EXHAUSTED if the cap stopped a candidate before it had an answer.
+    """
+    logging.info(f"Speculatively predicting on top {len(candidates)} images (spend cap: {budget.max_calls} calls)")
+
+    def recognize(image_link, claim):
+        try:
+            return model(image_link, budget=claim)
+        finally:
+            budget.release(claim.rank)
+
+    # Claimed before any recognition starts, so the best candidates' reservations hold from the first call
+    claims = [budget.claim(rank) for rank in range(len(candidates))]
+    futures = [get_speculation_pool().submit(recognize, image_link, claim)
+               for (image_link, _), claim in zip(candidates, claims)]
+
+    exhausted = False
+    try:
+        for (image_link, score), future in zip(candidates, futures):
+            try:
+                detail_number = str(future.result())
+            except SpendCapReached as e:
+                get_metrics().inc('speculative_cap_reached')
+                logging.info(f"Speculative recognition of {image_link} stopped: {e}")
+                exhausted = True
+                continue
+            except RecognitionCancelled as e:
+                get_metrics().inc('speculative_cancelled')
+                logging.info(f"Speculative recognition of {image_link} stopped: {e}")
+                continue
+            except Exception as e:
+                logging.warning(f"Error processing image {image_link}: {e}")
+                continue
+            if is_number(detail_number):
+                logging.info(f"Speculative winner {image_link} (score {score}) after {budget.calls} calls")
+                return detail_number, image_link
+    finally:
+        budget.cancel()
+        for future in futures:
+            future.cancel()
+
+    return BUDGET_EXHAUSTED if exhausted else 'none', candidates[0][0] if candidates else None
+
+
+
+@timed('recognition.recognize_images')
+def recognize_images(images_probs, model):
+    """
+    Run the recognizer over picker candidates in score order until one returns a number.
+
+    If the model has a top_k (GeminiInference multi-image mode), the top_k best candidates
+    are first recognised together in a single request; if that request fails they are
+    tried one at a time instead. Otherwise, if it has speculative_candidates, that many are
+    recognised concurrently by recognize_speculative. The remaining candidates are only
+    tried one at a time if that finds nothing; in speculative mode they share what is left
+    of the listing's speculative_max_calls, and the result is BUDGET_EXHAUSTED once it runs
+    out without a number.
+
+    Args:
+        images_probs (iterable): Picker output, dicts with 'image_link' and 'score' sorted by
+            score. It is consumed lazily, so a TargetModel.stream_candidates generator only
+            scores further images when the earlier ones had no number.
+        model (GeminiInference): The part number recognizer.
+
+    Returns:
+        tuple: (detail_number, target_image_link). detail_number is 'none' if no image had one.
+    """
+    detail_number = 'none'
+    target_image_link = None
+    candidates = ((i['image_link'], i['score']) for i in images_probs)
+
+    top_k = getattr(model, 'top_k', None)
+    if top_k and top_k > 1:
+        top_candidates = list(itertools.islice(candidates, top_k))
+        if top_candidates:
+            try:
+                logging.info(f"Predicting on top {len(top_candidates)} images in one request")
+                detail_number, target_image_link = model.recognize_top_k([l for l, _ in top_candidates])
+                detail_number = str(detail_number)
+            except Exception as e:
+                logging.warning(f"Error processing top {len(top_candidates)} images: {e}. Trying them one at a time")
+                candidates = itertools.chain(top_candidates, candidates)
+            if is_number(detail_number):
+                logging.info(f"Predicted number id: {detail_number}")
+                return detail_number, target_image_link
+
+    budget = None
+    speculative_candidates = getattr(model, 'speculative_candidates', None)
+    if not (top_k and top_k > 1) and speculative_candidates and speculative_candidates > 1:
+        top_candidates = list(itertools.islice(candidates, speculative_candidates))
+        if top_candidates:
+            speculative_budget = RequestBudget(model.speculative_max_calls)
+            detail_number, target_image_link = recognize_speculative(top_candidates, model, speculative_budget)
+            if is_number(detail_number) or detail_number == BUDGET_EXHAUSTED:
+                logging.info(f"Predicted number id: {detail_number}")
+                return detail_number, target_image_link
+            # The rest of the listing is paid for from what the speculative set left over
+            budget = RequestBudget(speculative_budget.remaining())
+
+    for target_image_link, score in candidates:
+        try:
+            logging.info(f'Predicting on image {target_image_link} with score {score}')
+            detail_number = str(model(target_image_link) if budget is None else model(target_image_link, budget=budget))
+
+            if detail_number.lower().strip() != 'none':
+                break
+        except SpendCapReached as e:
+            logging.warning(f"Stopped before {target_image_link}: {e}")
+            detail_number = BUDGET_EXHAUSTED
+            break
+        except Exception as e:
+            # Quota errors are already retried on other API keys by GeminiInference
+            logging.warning(f"Error processing image {target_image_link}: {e}")
+            continue
+
+    if not is_number(detail_number):
+        logging.warning("No detail number found in any image")
+
+    logging.info(f"Predicted number id: {detail_number}")
+    return detail_number, target_image_link
@@ -0,0 +1,76 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from config import Config as cfg
+from metrics import get_metrics
+
+
+class RecognitionCache():
+    """
+    Durable cache of final GeminiInference answers.
+
+    Entries are keyed by image content hash, car brand, prompt hash and Gemini model name,
+    and hold the extracted and validated part number (or NONE). Entries older than ttl
+    seconds are treated as misses, and the least recently used ones are evicted once the
+    cache holds more than max_entries.
+    """
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = path or cfg.recognition_cache_path
+        self.ttl = cfg.recognition_cache_ttl if ttl is None else ttl
+        self.max_entries = max_entries or cfg.recognition_cache_max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS recognitions ("
+                "key TEXT PRIMARY KEY, number TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS recognitions_last_access ON recognitions (last_access)")
+
+    @staticmethod
+    def make_key(image_digest, car_brand, prompt_hash, model_name):
+        return hashlib.sha256(f"{image_digest}|{car_brand}|{prompt_hash}|{model_name}".encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached number for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT number, created_at FROM recognitions WHERE key = ?", [key]).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM recognitions WHERE key = ?", [key])
+                row = None
+            if row is None:
+                self.misses += 1
+                get_metrics().inc('recognition_cache_misses')
+                return None
+            self.conn.execute("UPDATE recognitions SET last_access = ? WHERE key = ?", [now, key])
+            self.hits += 1
+            get_metrics().inc('recognition_cache_hits')
+            return row[0]
+
+    def put(self, key, number):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO recognitions VALUES (?, ?, ?, ?)", [key, number, now, now])
+            count = self.conn.execute("SELECT COUNT(*) FROM recognitions").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM recognitions WHERE key IN "
+                    "(SELECT key FROM recognitions ORDER BY last_access LIMIT ?)",
+                    [count - self.max_entries]
+                )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM recognitions").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+        }
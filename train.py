@@ -1,55 +1,290 @@
-from dataprocessor import load_data
-from tensorflow.data import Dataset 
-import tensorflow as tf
-
-tf.executing_eagerly()
+from dataprocessor import decode_and_resize, load_image_bytes, normalize_images, pil_decode_and_resize, read_label_files, tf
+from image_cache import get_image_cache
+from dataset_shards import load_shards, read_manifest
+import numpy as np
 
+import argparse
+import logging
+import math
+import os
+import random
 
+from config import Config as cfg
 from picker_model import TargetModel 
 
-def image_mapping_fn(image_link): 
-  image_link = bytes.decode(image_link.numpy())
-  # image_link = bytes.decode(image_link)
-
-  return load_data(image_link)
+def cache_image(image_link, session=None):
+  """Make image_link available on local disk and return its path, or None if it cannot be loaded."""
+  if not image_link.startswith("http"):
+    return image_link if os.path.exists(image_link) else None
+  # Downloads into the image cache and rejects content that is not an image
+  if load_image_bytes(image_link, session=session) is None:
+    return None
+  return get_image_cache().path(image_link)
 
 class Trainer(TargetModel): 
   def __init__(self, 
                dataset = None, 
-               dataset_path=None): 
-    super().__init__()
+               dataset_path=None,
+               init_weights=None): 
+    # Without a checkpoint at init_weights (default cfg.model_path), training starts from the ImageNet backbone
+    super().__init__(model_path=init_weights, use_embedding_cache=True, require_weights=False)
     
     if dataset == None: 
-      dataset = self.read_from_dataset_path(dataset_path)
+      # Training from shards needs no label files
+      dataset = self.read_from_dataset_path(dataset_path) if dataset_path else []
     self.dataset = dataset
 
+    # Later listings win for links that appear in several, as before
     self.dataset_dict = {} 
     for item in self.dataset: 
-      self.dataset_dict = {**self.dataset_dict, **item}
-
-  def read_from_dataset_path(self, dataset_folder): 
-    json_files = []
-    for root, dirs, files in os.walk(dataset_folder):
-      for file in files:
-        if file.endswith('.json'):
-          json_files.append(os.path.join(root, file))
-
-    data = []
-    for json_file in json_files:
-      with open(json_file, 'r') as f:
-        data.append(json.load(f))
-    return data 
-
-  def build_dataset(self): 
+      self.dataset_dict.update(item)
+
+  def read_from_dataset_path(self, dataset_path): 
+    # A folder of label files or the zip archive they were exported to
+    return read_label_files(dataset_path)
+
+  def cache_images(self, image_links):
+    """
+      Download every training image into the local image cache before training starts,
+      on the processor's download pool, so the input pipeline never touches the network.
+
+      Returns:
+        dict: image link -> local file path, for the images that could be loaded.
+    """
+    paths = {}
+    for i, (image_link, path) in enumerate(zip(image_links, self.processor.download_pool.map(
+        lambda l: cache_image(l, session=self.processor.session), image_links))):
+      if path is not None:
+        paths[image_link] = path
+      if (i + 1) % 1000 == 0:
+        logging.info(f"Cached {i + 1}/{len(image_links)} images")
+    logging.info(f"{len(paths)}/{len(image_links)} training images available locally")
+
+    image_cache = get_image_cache()
+    if image_cache.total_bytes > image_cache.max_bytes * 0.9:
+      logging.warning("The training images nearly fill the image cache, so some may be evicted. "
+                      "Raise cfg.image_cache_max_bytes.")
+    return paths
+
+  def split_links(self, validation_split, seed=0):
+    # Split by listing, so photos of one listing never end up on both sides
+    listings = list(self.dataset)
+    random.Random(seed).shuffle(listings)
+    num_validation = int(len(listings) * validation_split)
+    validation_links = {l for listing in listings[:num_validation] for l in listing}
+    train_links = {l for listing in listings[num_validation:] for l in listing}
+    return sorted(train_links), sorted(validation_links - train_links)
+
+  def build_dataset(self, paths, training=True, cache_path='', shuffle_buffer=2048): 
+    """
+      tf.data pipeline over local image files.
+
+      Encoded files are read once and cached (in memory, or in cache_path), then decoded,
+      resized and normalised by parallel maps. Images are resized the way the processor's
+      preprocess_mode does at inference, with PIL in 'pil' mode. For training, positives
+      and negatives are repeated, shuffled and drawn in equal proportion.
+
+      Args:
+        paths: dict of image link -> local path, as returned by cache_images.
+        training: Build the balanced, repeated training stream instead of one ordered pass.
+        cache_path: File to cache the encoded images in; '' caches in memory.
+        shuffle_buffer: Encoded images held per class for shuffling.
+
+      Returns:
+        A dataset of (images, labels) batches.
+    """
+    image_size = self.processor.image_size
+
+    def read(path, label):
+      return tf.io.read_file(path), label
+
+    def decode(image_bytes, label):
+      if self.processor.preprocess_mode == 'graph':
+        return decode_and_resize(image_bytes, image_size), label
+      img = tf.numpy_function(lambda b: pil_decode_and_resize(b, image_size), [image_bytes], tf.uint8)
+      img.set_shape((*image_size, cfg.image_channels))
+      return img, label
+
+    def normalize(images, labels):
+      return normalize_images(images), labels
+
+    def encoded_dataset(links, suffix):
+      dataset = tf.data.Dataset.from_tensor_slices((
+          [paths[l] for l in links],
+          np.array([self.dataset_dict[l] for l in links], dtype=np.float32)))
+      dataset = dataset.map(read, num_parallel_calls=tf.data.AUTOTUNE)
+      return dataset.cache(f"{cache_path}.{suffix}" if cache_path else '')
+
+    links = sorted(paths)
+    if training:
+      by_label = [[l for l in links if self.dataset_dict[l] == label] for label in (0, 1)]
+      logging.info(f"Training on {len(by_label[0])} negative and {len(by_label[1])} positive images")
+      streams = [encoded_dataset(label_links, f"train{label}").shuffle(min(len(label_links), shuffle_buffer)).repeat()
+                 for label, label_links in enumerate(by_label) if label_links]
+      dataset = tf.data.Dataset.sample_from_datasets(streams, weights=[1 / len(streams)] * len(streams))
+    else:
+      dataset = encoded_dataset(links, "validation")
+
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    # Drop the odd file TF cannot decode instead of failing the epoch
+    dataset = dataset.ignore_errors()
+    dataset = dataset.batch(self.processor.batch_size)
+    dataset = dataset.map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+
+    options = tf.data.Options()
+    options.deterministic = not training
+    return dataset.with_options(options).prefetch(tf.data.AUTOTUNE)
+
+  def train(self, epochs=20, validation_split=0.1, save_path=None, cache_path=''): 
+    """
+      Train the picker head on images through the tf.data pipeline, with the backbone frozen.
+    """
+    train_links, validation_links = self.split_links(validation_split)
+    paths = self.cache_images(train_links + validation_links)
+    train_paths = {l: paths[l] for l in train_links if l in paths}
+    validation_paths = {l: paths[l] for l in validation_links if l in paths}
+    if not any(self.dataset_dict[l] for l in train_paths):
+      raise ValueError("No positive training images could be loaded")
+
+    train_dataset = self.build_dataset(train_paths, training=True, cache_path=cache_path)
+    validation_dataset = self.build_dataset(validation_paths, training=False, cache_path=cache_path) if validation_paths else None
+
+    # Balanced sampling repeats forever, so an epoch is one pass worth of images
+    steps_per_epoch = math.ceil(len(train_paths) / self.processor.batch_size)
+    history = self.model.fit(train_dataset, epochs=epochs, steps_per_epoch=steps_per_epoch,
+                             validation_data=validation_dataset)
+
+    save_path = save_path or cfg.model_path
+    self.model.save_weights(save_path)
+    logging.info(f"Saved trained weights to {save_path}")
+    return history
+
+  def shard_dataset(self, shard_dir, split, training=True, shuffle_buffer=512):
+    """
+      Batched (images, labels) from a shard directory written by dataset_shards.py, with
+      the same balanced sampling as build_dataset for training.
+    """
+    def drop_listing_id(image, label, listing_id):
+      return image, label
+
+    def normalize(images, labels):
+      return normalize_images(images), labels
+
+    dataset = load_shards(shard_dir, split).map(drop_listing_id, num_parallel_calls=tf.data.AUTOTUNE)
+    if training:
+      def has_label(label):
+        return lambda image, l: tf.equal(l, label)
+
+      streams = [dataset.filter(has_label(label)).shuffle(shuffle_buffer).repeat() for label in (0.0, 1.0)]
+      dataset = tf.data.Dataset.sample_from_datasets(streams, weights=[0.5, 0.5])
+    dataset = dataset.batch(self.processor.batch_size)
+    dataset = dataset.map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+
+    options = tf.data.Options()
+    options.deterministic = not training
+    return dataset.with_options(options).prefetch(tf.data.AUTOTUNE)
+
+  def train_from_shards(self, shard_dir, epochs=20, save_path=None):
+    """
+      Train the picker head from local shards, validating on their eval split.
+    """
+    manifest = read_manifest(shard_dir)
+    if tuple(manifest['image_size']) != tuple(self.processor.image_size):
+      raise ValueError(f"Shards hold {manifest['image_size']} images but the picker expects {self.processor.image_size}")
+    # Shards written before the manifest recorded it were resized in the graph
+    if manifest.get('preprocess_mode', 'graph') != self.processor.preprocess_mode:
+      raise ValueError(f"Shards were resized for preprocess mode '{manifest.get('preprocess_mode', 'graph')}' but the picker "
+                       f"uses '{self.processor.preprocess_mode}'. Rebuild them with dataset_shards.py")
+    train_split = manifest['splits']['train']
+    if not train_split['positives'] or train_split['positives'] == train_split['examples']:
+      raise ValueError("The train split needs both positive and negative images")
+    logging.info(f"Training on {train_split['examples']} images ({train_split['positives']} positive) from {shard_dir}")
+
+    validation_dataset = self.shard_dataset(shard_dir, 'eval', training=False) if manifest['splits']['eval']['examples'] else None
+    steps_per_epoch = math.ceil(train_split['examples'] / self.processor.batch_size)
+    history = self.model.fit(self.shard_dataset(shard_dir, 'train'), epochs=epochs, steps_per_epoch=steps_per_epoch,
+                             validation_data=validation_dataset)
+
+    save_path = save_path or cfg.model_path
+    self.model.save_weights(save_path)
+    logging.info(f"Saved trained weights to {save_path}")
+    return history
+
+  def evaluate_from_shards(self, shard_dir, split='eval'):
+    return self.model.evaluate(self.shard_dataset(shard_dir, split, training=False), return_dict=True)
+
+  def build_embedding_dataset(self, chunk_size=256):
+    # Backbone embeddings come from the embedding store; only new images run through the CNN
     image_links = list(self.dataset_dict.keys())
-    labels = list(self.dataset_dict.values()) 
+    embedded = {}
+    for i in range(0, len(image_links), chunk_size):
+      embedded.update(self.embed_links(image_links[i:i + chunk_size]))
+      logging.info(f"Embedded {min(i + chunk_size, len(image_links))}/{len(image_links)} images")
+
+    image_links = [l for l in image_links if l in embedded]
+    x = np.stack([embedded[l] for l in image_links])
+    y = np.array([self.dataset_dict[l] for l in image_links], dtype=np.float32)
+    return x, y
+
+  def train_head_from_embeddings(self, epochs=20, validation_split=0.1, save_path=None):
+    x, y = self.build_embedding_dataset()
+    logging.info(f"Training head on {len(y)} embeddings ({int(y.sum())} positive)")
+
+    # Keras takes the validation split from the end, so shuffle before fitting
+    order = np.random.permutation(len(y))
+    x, y = x[order], y[order]
+
+    # Every listing has one label photo among many negatives
+    positives = max(float(y.sum()), 1.0)
+    class_weight = {0: len(y) / (2 * max(len(y) - positives, 1.0)), 1: len(y) / (2 * positives)}
+
+    history = self.head.fit(x, y, epochs=epochs, batch_size=cfg.batch_size,
+                            validation_split=validation_split, class_weight=class_weight)
+
+    # The head shares its layers with the full model, so this saves a complete checkpoint
+    save_path = save_path or cfg.model_path
+    self.model.save_weights(save_path)
+    logging.info(f"Saved trained weights to {save_path}")
+    return history
+
+def parse_args():
+    """
+    Main usage Example: 
     
-    self.dataset = (Dataset.from_tensor_slices({"image": image_links, "l": labels})
-    .map(lambda i: {"image": tf.py_function(image_mapping_fn, [(i['image'])], [tf.float32]), "label": i['l']}))
-    return self.dataset.batch(128)
+        python train.py --dataset-path predicted_data-20240821T151905Z-001.zip --epochs 20 --save-path trained.weights.h5
+        python train.py --shards picker_shards --epochs 20 --save-path trained.weights.h5
+        
+    """
+    parser = argparse.ArgumentParser(description="Train the picker head on the labelled listings")
+
+    parser.add_argument('--dataset-path', type=str, default=None, help="Folder or zip archive of per-listing JSON label files, e.g. predicted_data")
+    parser.add_argument('--shards', type=str, default=None, help="Train and evaluate from a shard directory built by dataset_shards.py instead")
+    parser.add_argument('--evaluate-only', action='store_true', help="With --shards, only evaluate the current weights on the eval split")
+    parser.add_argument('--epochs', type=int, default=20, help="Number of epochs to train the head for")
+    parser.add_argument('--init-weights', type=str, default=cfg.model_path, help="Checkpoint to start from. Training starts from the ImageNet backbone if it does not exist")
+    parser.add_argument('--save-path', type=str, default='trained.weights.h5', help="Where to save the trained weights (must end with .weights.h5)")
+    parser.add_argument('--validation-split', type=float, default=0.1, help="Fraction of listings held out for validation")
+    parser.add_argument('--cache-path', type=str, default='', help="File to cache encoded training images in (default: in memory)")
+    parser.add_argument('--from-embeddings', action='store_true', help="Train the head on stored backbone embeddings instead of images")
+
+    args = parser.parse_args()
+    if (args.dataset_path is None) == (args.shards is None):
+      parser.error("Pass exactly one of --dataset-path and --shards")
+    if args.evaluate_only and args.shards is None:
+      parser.error("--evaluate-only needs --shards")
+
+    return args
 
-  def train(self): 
-    dataset = self.build_dataset()
+if __name__ == '__main__':
+  args = parse_args()
 
-trainer = Trainer(dataset = correct_answers)
-trainer.train()
+  trainer = Trainer(dataset_path=args.dataset_path, init_weights=args.init_weights)
+  if args.shards and args.evaluate_only:
+    logging.info(f"Eval metrics: {trainer.evaluate_from_shards(args.shards)}")
+  elif args.shards:
+    trainer.train_from_shards(args.shards, epochs=args.epochs, save_path=args.save_path)
+  elif args.from_embeddings:
+    trainer.train_head_from_embeddings(epochs=args.epochs, validation_split=args.validation_split, save_path=args.save_path)
+  else:
+    trainer.train(epochs=args.epochs, validation_split=args.validation_split, save_path=args.save_path,
+                  cache_path=args.cache_path)